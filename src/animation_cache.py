@@ -0,0 +1,134 @@
+# animation_cache.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from collections import OrderedDict
+
+from gi.repository import Gdk, GLib
+
+from . import logger_lib
+
+MEMORY_FORMATS = {
+    3: Gdk.MemoryFormat.R8G8B8,
+    4: Gdk.MemoryFormat.R8G8B8A8,
+}
+
+
+# F3D images start from the bottom row, GDK textures from the top one
+def image_to_texture(image):
+    width, height = image.width, image.height
+    channels = image.channel_count
+    stride = width * channels
+
+    content = image.content
+    rows = [content[row * stride : (row + 1) * stride] for row in range(height)]
+    data = GLib.Bytes.new(b"".join(reversed(rows)))
+
+    return Gdk.MemoryTexture.new(width, height, MEMORY_FORMATS[channels], data, stride)
+
+
+class AnimationCache:
+    """Rendered frames of the animation sampled at a fixed rate, valid only
+    for the view they were rendered with and bounded by a memory budget."""
+
+    def __init__(self, sample_rate=30.0, memory_budget=512 * 1024 * 1024):
+        self.logger = logger_lib.logger
+
+        self.sample_rate = sample_rate
+        self.memory_budget = memory_budget
+
+        self.signature = None
+        self.lower = 0.0
+        self.upper = 0.0
+
+        self._frames = OrderedDict()
+        self._size = 0
+        self._full = False
+
+    @property
+    def full(self):
+        return self._full
+
+    def __len__(self):
+        return len(self._frames)
+
+    # Drops all the frames if the view or the time range changed
+    def validate(self, signature, lower, upper):
+        if (signature, lower, upper) == (self.signature, self.lower, self.upper):
+            return True
+
+        if self._frames:
+            self.logger.debug(f"Dropping {len(self._frames)} cached frames")
+
+        self.signature = signature
+        self.lower = lower
+        self.upper = upper
+
+        self.clear()
+        return False
+
+    def clear(self):
+        self._frames.clear()
+        self._size = 0
+        self._full = False
+
+    def get_sample(self, animation_time):
+        return round((animation_time - self.lower) * self.sample_rate)
+
+    def get_sample_time(self, sample):
+        return min(self.upper, self.lower + sample / self.sample_rate)
+
+    def get_sample_count(self):
+        return self.get_sample(self.upper) + 1
+
+    def lookup(self, animation_time):
+        sample = self.get_sample(animation_time)
+        texture = self._frames.get(sample)
+        if texture:
+            self._frames.move_to_end(sample)
+        return texture
+
+    # The first sample without a frame, starting from the given time and
+    #   wrapping around, so playing from there hits the cache first
+    def next_missing_sample(self, animation_time):
+        if self._full:
+            return None
+
+        count = self.get_sample_count()
+        start = max(0, min(count - 1, self.get_sample(animation_time)))
+        for offset in range(count):
+            sample = (start + offset) % count
+            if sample not in self._frames:
+                return sample
+        return None
+
+    # Textures are counted as 4 bytes per pixel, like they are uploaded
+    def add(self, sample, texture):
+        size = texture.get_width() * texture.get_height() * 4
+        if size > self.memory_budget:
+            self._full = True
+            return
+
+        self._frames[sample] = texture
+        self._size += size
+
+        # Once something has been evicted there is no room for more frames
+        while self._size > self.memory_budget:
+            _sample, evicted = self._frames.popitem(last=False)
+            self._size -= evicted.get_width() * evicted.get_height() * 4
+            self._full = True
@@ -0,0 +1,220 @@
+# batch_render.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+
+from gettext import gettext as _
+
+from . import logger_lib
+from .settings_manager import WindowSettings
+from .f3d_options import to_f3d_options
+from .configurations import (
+    PresetIndex,
+    load_configurations,
+    find_configuration,
+    get_user_configurations_path,
+)
+
+# The offscreen engine of a worker process, reused for all its files
+_engine = None
+
+
+def parse_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(_("Size must be WIDTHxHEIGHT"))
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(_("Size must be positive"))
+    return width, height
+
+
+def expand_files(patterns):
+    filepaths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(os.path.expanduser(pattern), recursive=True))
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        for match in matches:
+            match = os.path.abspath(match)
+            if os.path.isfile(match) and match not in filepaths:
+                filepaths.append(match)
+    return filepaths
+
+
+def get_render_options(configuration):
+    options = WindowSettings.default_settings.copy()
+    options.update(configuration["view-settings"])
+
+    other_settings = WindowSettings.other_settings.copy()
+    other_settings.update(configuration["other-settings"])
+    if not other_settings["use-color"]:
+        options["bg-color"] = [1.0, 1.0, 1.0]
+
+    return to_f3d_options(options)
+
+
+# The folders of the files are mirrored under output_dir, starting from the
+#   folder they all share, so files with the same name don't overwrite
+#   each other
+def get_output_path(filepath, output_dir, input_dir):
+    name = os.path.splitext(os.path.relpath(filepath, input_dir))[0]
+    return os.path.join(output_dir, name + ".png")
+
+
+def _init_worker(width, height):
+    global _engine
+
+    import f3d
+
+    _engine = f3d.Engine.create(True)
+    _engine.autoload_plugins()
+    _engine.window.size = (width, height)
+
+
+def render_file(job):
+    filepath, output_path, options = job
+
+    start = time.perf_counter()
+    try:
+        _engine.scene.clear()
+        _engine.options.update(options)
+        _engine.scene.add(filepath)
+        loaded = time.perf_counter()
+
+        _engine.window.camera.reset_to_bounds()
+        image = _engine.window.render_to_image()
+        rendered = time.perf_counter()
+
+        image.save(output_path)
+        saved = time.perf_counter()
+    except Exception as e:
+        return {"filepath": filepath, "error": str(e)}
+
+    return {
+        "filepath": filepath,
+        "output": output_path,
+        "load": (loaded - start) * 1000,
+        "render": (rendered - loaded) * 1000,
+        "save": (saved - rendered) * 1000,
+        "total": (saved - start) * 1000,
+    }
+
+
+def print_report(results, elapsed):
+    print(f"{'load':>9} {'render':>9} {'save':>9} {'total':>9}  file")
+
+    failed = 0
+    for result in results:
+        name = os.path.basename(result["filepath"])
+        if "error" in result:
+            failed += 1
+            print(f"{'-':>9} {'-':>9} {'-':>9} {'-':>9}  {name}: {result['error']}")
+            continue
+        print(
+            f"{result['load']:7.1f}ms {result['render']:7.1f}ms "
+            f"{result['save']:7.1f}ms {result['total']:7.1f}ms  {name}"
+        )
+
+    rendered = len(results) - failed
+    print(
+        f"\nRendered {rendered} of {len(results)} files in {elapsed:.2f}s"
+        + (f" ({rendered / elapsed:.2f} files/s)" if elapsed > 0 else "")
+    )
+    return failed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog="exhibit --render",
+        description=_("Render 3D models to PNG images without opening a window"),
+    )
+    parser.add_argument(
+        "files", nargs="+", help=_("Model files or glob patterns to render")
+    )
+    parser.add_argument(
+        "-c",
+        "--configuration",
+        default="auto",
+        help=_("Configuration to use, auto picks the best one for each file"),
+    )
+    parser.add_argument(
+        "-o", "--output", default=".", help=_("Directory where to save the images")
+    )
+    parser.add_argument(
+        "-s",
+        "--size",
+        type=parse_size,
+        default=(1920, 1080),
+        help=_("Size of the images, as WIDTHxHEIGHT"),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help=_("Number of files to render in parallel"),
+    )
+    args = parser.parse_args(argv)
+
+    logger_lib.init()
+
+    configurations = load_configurations(get_user_configurations_path())
+
+    configuration = None
+    if args.configuration != "auto":
+        configuration = find_configuration(configurations, args.configuration)
+        if configuration is None:
+            print(_("Unknown configuration: {}").format(args.configuration))
+            return 2
+
+    filepaths = expand_files(args.files)
+    if not filepaths:
+        print(_("No files to render"))
+        return 2
+
+    input_dir = os.path.commonpath([os.path.dirname(path) for path in filepaths])
+
+    preset_index = PresetIndex(configurations)
+
+    jobs = []
+    for filepath in filepaths:
+        key = configuration or preset_index.get_best(filepath)
+        options = get_render_options(configurations[key])
+        output_path = get_output_path(filepath, args.output, input_dir)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        jobs.append((filepath, output_path, options))
+
+    processes = max(1, min(args.jobs, len(jobs)))
+    logger_lib.logger.info(f"Rendering {len(jobs)} files with {processes} workers")
+
+    start = time.perf_counter()
+    # Every worker owns an engine, spawn so they don't inherit any state
+    with multiprocessing.get_context("spawn").Pool(
+        processes, initializer=_init_worker, initargs=args.size
+    ) as pool:
+        results = pool.map(render_file, jobs, chunksize=1)
+    elapsed = time.perf_counter() - start
+
+    failed = print_report(results, elapsed)
+    return 1 if failed else 0
@@ -0,0 +1,278 @@
+# configurations.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import re
+import json
+
+from gi.repository import Gio, GLib, GObject
+
+from . import logger_lib
+from . import tracing
+from .file_utils import file_stamp
+
+CONFIGURATIONS_RESOURCE = "/io/github/nokse22/Exhibit/configurations.json"
+
+REQUIRED_KEYS = {"name", "formats", "view-settings", "other-settings"}
+
+FALLBACK_CONFIGURATION = "general"
+
+# Most formats are written as .*(ext1|ext2), they can be looked up by extension
+#   instead of being matched against the whole path
+EXTENSIONS_FORMAT = re.compile(r"^\.\*\(([\w|]*)\)$")
+
+
+def get_user_configurations_path():
+    return os.environ["XDG_DATA_HOME"] + "/configurations/"
+
+
+def load_configurations(user_configurations_path):
+    configurations = Gio.resources_lookup_data(
+        CONFIGURATIONS_RESOURCE, Gio.ResourceLookupFlags.NONE
+    ).get_data().decode("utf-8")
+    configurations = json.loads(configurations)
+
+    # The folder is only created by the registry, it's missing on a fresh
+    #   install when rendering from the command line
+    if not os.path.isdir(user_configurations_path):
+        return configurations
+
+    for filename in sorted(os.listdir(user_configurations_path)):
+        if filename.endswith(".json"):
+            filepath = os.path.join(user_configurations_path, filename)
+            with open(filepath, "r") as file:
+                try:
+                    configuration = json.load(file)
+
+                    # Check if the loaded configurations
+                    #   has all the required keys
+                    first_key_value = next(iter(configuration.values()))
+                    if REQUIRED_KEYS.issubset(first_key_value.keys()):
+                        configurations.update(configuration)
+                    else:
+                        logger_lib.logger.error(
+                            f"Error: {filepath} is missing required keys."
+                        )
+
+                except json.JSONDecodeError as e:
+                    logger_lib.logger.error(f"Error reading {filename}: {e}")
+
+    return configurations
+
+
+def get_extension(filepath):
+    return os.path.splitext(filepath)[1][1:].lower()
+
+
+class PresetMatch:
+    def __init__(self, key, name, priority, order, reason):
+        self.key = key
+        self.name = name
+        self.priority = priority
+        self.order = order
+        self.reason = reason
+
+    # Higher priority wins, then the configuration loaded last, so user
+    #   configurations win over the default ones
+    @property
+    def rank(self):
+        return self.priority, self.order
+
+    def explain(self):
+        return f"{self.name} ({self.key}): {self.reason}, priority {self.priority}"
+
+    def __repr__(self):
+        return f"<PresetMatch {self.key}: {self.reason}>"
+
+
+class PresetIndex:
+    """The formats of the configurations compiled once, extensions are
+    looked up in a dictionary and only the formats that aren't a plain list
+    of extensions are matched as regular expressions."""
+
+    def __init__(self, configurations):
+        self.logger = logger_lib.logger
+
+        self._by_extension = {}
+        self._patterns = []
+
+        for order, (key, configuration) in enumerate(configurations.items()):
+            self._add(order, key, configuration)
+
+        self.logger.debug(
+            f"Indexed {len(self._by_extension)} extensions "
+            f"and {len(self._patterns)} patterns"
+        )
+
+    def _add(self, order, key, configuration):
+        formats = configuration["formats"]
+        name = configuration["name"]
+        priority = configuration.get("priority", 0)
+        # It comes from the user's files, anything else than a number would
+        #   break the comparisons
+        if isinstance(priority, bool) or not isinstance(priority, (int, float)):
+            self.logger.warning(f"Invalid priority {priority!r} in {key}, using 0")
+            priority = 0
+
+        match = EXTENSIONS_FORMAT.match(formats)
+        if match:
+            for extension in match.group(1).lower().split("|"):
+                if extension == "":
+                    continue
+                candidate = PresetMatch(
+                    key, name, priority, order, f"handles .{extension} files"
+                )
+                best = self._by_extension.get(extension)
+                if best is None or candidate.rank > best.rank:
+                    self._by_extension[extension] = candidate
+            return
+
+        try:
+            pattern = re.compile(formats)
+        except re.error as e:
+            self.logger.error(f"Invalid formats {formats} in {key}: {e}")
+            return
+
+        self._patterns.append(
+            (pattern, PresetMatch(key, name, priority, order, f"matches {formats}"))
+        )
+
+    def match(self, filepath):
+        best = self._by_extension.get(get_extension(filepath))
+
+        for pattern, candidate in self._patterns:
+            if (best is None or candidate.rank > best.rank) and pattern.search(
+                filepath
+            ):
+                best = candidate
+
+        return best
+
+    def get_best(self, filepath):
+        match = self.match(filepath)
+        return match.key if match else FALLBACK_CONFIGURATION
+
+    def explain(self, filepath):
+        match = self.match(filepath)
+        if match:
+            return match.explain()
+        return f"{FALLBACK_CONFIGURATION}: no configuration handles {filepath}"
+
+
+def find_configuration(configurations, name):
+    if name in configurations:
+        return name
+    for key, value in configurations.items():
+        if value["name"].lower() == name.lower():
+            return key
+    return None
+
+
+class ConfigurationRegistry(GObject.Object):
+    """The configurations shared by all the windows, parsed once and parsed
+    again only when the configurations folder changes."""
+
+    __gtype_name__ = "ConfigurationRegistry"
+
+    __gsignals__ = {
+        "changed": (GObject.SignalFlags.RUN_FIRST, None, ()),
+    }
+
+    _default = None
+
+    def __init__(self, user_configurations_path):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self.user_configurations_path = user_configurations_path
+        os.makedirs(self.user_configurations_path, exist_ok=True)
+
+        self.configurations = {}
+        self.preset_index = None
+
+        self._monitor = None
+        self._reload_source = None
+        # The files written by save(), with what they were like after it, the
+        #   monitor events they cause don't need another reload
+        self._saved_stamps = {}
+
+        self._load()
+        self._watch()
+
+    @classmethod
+    def get_default(cls):
+        if cls._default is None:
+            cls._default = cls(get_user_configurations_path())
+        return cls._default
+
+    def save(self, key, configuration):
+        filepath = os.path.join(self.user_configurations_path, key + ".json")
+        with open(filepath, "w") as file:
+            json.dump({key: configuration}, file, indent=4)
+        self._saved_stamps[filepath] = file_stamp(filepath)
+
+        self.reload()
+
+    def reload(self):
+        if self._reload_source:
+            GLib.source_remove(self._reload_source)
+            self._reload_source = None
+
+        self._load()
+        self.emit("changed")
+
+    def _load(self):
+        with tracing.span("load-configurations"):
+            self.configurations = load_configurations(self.user_configurations_path)
+            self.preset_index = PresetIndex(self.configurations)
+        self.logger.info(f"Loaded {len(self.configurations)} configurations")
+
+    def _watch(self):
+        gfile = Gio.File.new_for_path(self.user_configurations_path)
+        try:
+            self._monitor = gfile.monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None
+            )
+        except GLib.Error as e:
+            self.logger.warning(f"Couldn't monitor the configurations: {e}")
+            return
+
+        self._monitor.connect("changed", self._on_folder_changed)
+
+    def _on_folder_changed(self, monitor, file, other_file, event_type):
+        # Wait for CHANGES_DONE_HINT, files are written in many chunks
+        if event_type == Gio.FileMonitorEvent.CHANGED:
+            return
+
+        filepath = file.get_path()
+        if filepath in self._saved_stamps:
+            if file_stamp(filepath) == self._saved_stamps[filepath]:
+                return
+            del self._saved_stamps[filepath]
+
+        if self._reload_source:
+            GLib.source_remove(self._reload_source)
+        self._reload_source = GLib.timeout_add(300, self._on_reload_timeout)
+
+    def _on_reload_timeout(self):
+        self._reload_source = None
+        self.logger.info("The configurations folder changed")
+        self.reload()
+        return False
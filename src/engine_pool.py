@@ -0,0 +1,152 @@
+# engine_pool.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from gi.repository import GLib
+
+from . import logger_lib
+
+# Engines kept ready at most, every engine holds its own render window
+MAX_POOL_SIZE = 8
+
+
+def get_backend():
+    if GLib.getenv("WAYLAND_DISPLAY"):
+        return "egl"
+    elif GLib.getenv("DISPLAY"):
+        return "glx"
+    return "automatic"
+
+
+# External engines render with the GL context of the viewer, so like its
+#   own engine they are created on the main thread and only their scene is
+#   loaded from other threads. Automatic engines own their context and stay
+#   on the thread that creates them
+def create_engine(backend, options):
+    import f3d
+
+    match backend:
+        case "egl":
+            engine = f3d.Engine.create_external_egl()
+        case "glx":
+            engine = f3d.Engine.create_external_glx()
+        case _:
+            engine = f3d.Engine.create(True)
+
+    if engine:
+        engine.autoload_plugins()
+        engine.options.update(options)
+
+    return engine
+
+
+# For threads that need an external engine, waits for the main loop to
+#   create it
+def create_engine_from_thread(factory, options):
+    result = []
+    created = threading.Event()
+
+    def create():
+        try:
+            result.append(factory(options))
+        except Exception as e:
+            result.append(e)
+        created.set()
+        return GLib.SOURCE_REMOVE
+
+    GLib.idle_add(create)
+    created.wait()
+
+    if isinstance(result[0], Exception):
+        raise result[0]
+    return result[0]
+
+
+class EnginePool:
+    """Engines for the windows of files opened together, created on the
+    main thread while the main loop is idle, between the windows. Every
+    window takes one when it initializes its viewer and the engines left
+    are dropped once the last window has one."""
+
+    _default = None
+
+    def __init__(self):
+        self.logger = logger_lib.logger
+
+        self._engines = []
+        # Windows that still have to initialize their viewer
+        self._windows = 0
+        self._source_id = None
+
+    @classmethod
+    def get_default(cls):
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def warm(self, window_count):
+        self._windows = window_count
+        self._schedule()
+
+    def take(self, backend):
+        engine = None
+        for index, (engine_backend, pooled_engine) in enumerate(self._engines):
+            if engine_backend == backend:
+                engine = pooled_engine
+                del self._engines[index]
+                break
+
+        if self._windows > 0:
+            self._windows -= 1
+            if self._windows == 0:
+                self.clear()
+
+        return engine
+
+    def clear(self):
+        self._windows = 0
+        self._engines = []
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+    def _schedule(self):
+        if self._source_id is None and self._windows > 0:
+            self._source_id = GLib.idle_add(self._create_next)
+
+    def _create_next(self):
+        if len(self._engines) >= min(self._windows, MAX_POOL_SIZE):
+            self._source_id = None
+            return GLib.SOURCE_REMOVE
+
+        backend = get_backend()
+        try:
+            engine = create_engine(backend, {})
+        except Exception as e:
+            self.logger.warning(f"Couldn't create a pooled engine: {e}")
+            engine = None
+
+        if not engine:
+            self._source_id = None
+            return GLib.SOURCE_REMOVE
+
+        self._engines.append((backend, engine))
+        self.logger.debug(f"{len(self._engines)} pooled engines ready")
+        return GLib.SOURCE_CONTINUE
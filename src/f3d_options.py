@@ -0,0 +1,75 @@
+# f3d_options.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Exhibit setting names and the libf3d options they map to
+OPTION_KEYS = {
+    "grid": "render.grid.enable",
+    "grid-absolute": "render.grid.absolute",
+    "translucency-support": "render.effect.translucency_support",
+    "tone-mapping": "render.effect.tone_mapping",
+    "ambient-occlusion": "render.effect.ambient_occlusion",
+    "anti-aliasing": "render.effect.antialiasing.enable",
+    "hdri-ambient": "render.hdri.ambient",
+    "hdri-skybox": "render.background.skybox",
+    "light-intensity": "render.light.intensity",
+    "orthographic": "scene.camera.orthographic",
+    "blur-background": "render.background.blur.enable",
+    "blur-coc": "render.background.blur.coc",
+    "bg-color": "render.background.color",
+    "show-edges": "render.show_edges",
+    "edges-width": "render.line_width",
+    "up": "scene.up_direction",
+    "sprite-enabled": "model.point_sprites.enable",
+    "sprites-size": "model.point_sprites.size",
+    "sprites-type": "model.point_sprites.type",
+    "point-size": "render.point_size",
+    "model-color": "model.color.rgb",
+    "model-metallic": "model.material.metallic",
+    "model-roughness": "model.material.roughness",
+    "model-opacity": "model.color.opacity",
+    "scivis-component": "model.scivis.component",
+    "hdri-file": "render.hdri.file",
+    "cells": "model.scivis.cells",
+    "scivis-enabled": "model.scivis.enable",
+    "armature-enable": "render.armature.enable",
+    # The following settings don't have an UI
+    "texture-matcap": "model.matcap.texture",
+    "texture-base-color": "model.color.texture",
+    "emissive-factor": "model.emissive.factor",
+    "texture-emissive": "model.emissive.texture",  # rename to material-emissive
+    "texture-material": "model.material.texture",  # rename to material-texture
+    "normal-scale": "model.normal.scale",
+    "texture-normal": "model.normal.texture",  # rename to normal-texture
+    "volume": "model.volume.enable",  # rename to volume-enabled
+    "inverse": "model.volume.inverse",  # rename to volume-inverse
+    "final-shader": "render.effect.final_shader",
+    "grid-unit": "render.grid.unit",
+    "grid-subdivisions": "render.grid.subdivisions",
+    "grid-color": "render.grid.color",
+    "scalar": "model.scivis.array_name",  # rename to scivis-name
+    "animation-index": "scene.animation.index",
+}
+
+
+def to_f3d_options(options):
+    f3d_options = {}
+    for key, value in options.items():
+        if key in OPTION_KEYS:
+            f3d_options[OPTION_KEYS[key]] = value
+    return f3d_options
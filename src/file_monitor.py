@@ -0,0 +1,284 @@
+# file_monitor.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+
+from gi.repository import Gio, GLib, GObject
+
+from . import logger_lib
+from .file_utils import file_stamp
+
+# Only the head of an OBJ file is scanned for mtllib statements, exporters
+#   always write them before the geometry
+OBJ_HEADER_SIZE = 1024 * 1024
+
+MTL_TEXTURE_KEYWORDS = (
+    "map_",
+    "bump",
+    "disp",
+    "decal",
+    "norm",
+    "refl",
+)
+
+WATCHED_EVENTS = (
+    Gio.FileMonitorEvent.CHANGED,
+    Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+    Gio.FileMonitorEvent.CREATED,
+    Gio.FileMonitorEvent.DELETED,
+    Gio.FileMonitorEvent.MOVED_IN,
+    Gio.FileMonitorEvent.MOVED_OUT,
+    Gio.FileMonitorEvent.RENAMED,
+    Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+)
+
+
+def _resolve(base_dir, relative_path):
+    relative_path = relative_path.strip().strip('"').replace("\\", "/")
+    if relative_path == "":
+        return None
+    return os.path.normpath(os.path.join(base_dir, relative_path))
+
+
+def _obj_sidecars(filepath):
+    base_dir = os.path.dirname(filepath)
+    sidecars = []
+
+    with open(filepath, "r", errors="ignore") as file:
+        header = file.read(OBJ_HEADER_SIZE)
+
+    for line in header.splitlines():
+        if line.startswith("mtllib"):
+            mtl_path = _resolve(base_dir, line[len("mtllib"):])
+            if mtl_path:
+                sidecars.append(mtl_path)
+
+    for mtl_path in list(sidecars):
+        if not os.path.isfile(mtl_path):
+            continue
+        mtl_dir = os.path.dirname(mtl_path)
+        with open(mtl_path, "r", errors="ignore") as file:
+            for line in file:
+                line = line.strip()
+                if line.lower().startswith(MTL_TEXTURE_KEYWORDS):
+                    # Options like -bm 1.0 come before the texture path
+                    texture_path = _resolve(mtl_dir, line.split()[-1])
+                    if texture_path:
+                        sidecars.append(texture_path)
+
+    return sidecars
+
+
+def _gltf_sidecars(filepath):
+    base_dir = os.path.dirname(filepath)
+    sidecars = []
+
+    with open(filepath, "r") as file:
+        gltf = json.load(file)
+
+    for entry in gltf.get("buffers", []) + gltf.get("images", []):
+        uri = entry.get("uri", "")
+        if uri and not uri.startswith("data:"):
+            path = _resolve(base_dir, GLib.Uri.unescape_string(uri) or uri)
+            if path:
+                sidecars.append(path)
+
+    return sidecars
+
+
+def find_sidecar_files(filepath):
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    try:
+        match extension:
+            case "obj":
+                return _obj_sidecars(filepath)
+            case "gltf":
+                return _gltf_sidecars(filepath)
+    except Exception as e:
+        logger_lib.logger.warning(f"Couldn't find sidecar files of {filepath}: {e}")
+    return []
+
+
+class FileWatcher(GObject.Object):
+    """Watches model files and their sidecar files and emits a single
+    changed signal once a burst of writes has settled."""
+
+    __gtype_name__ = "FileWatcher"
+
+    __gsignals__ = {
+        "changed": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
+    }
+
+    def __init__(self, debounce=300, poll_interval=500):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+
+        self._filepaths = []
+        self._files = []
+        self._stamps = {}
+        self._pending_stamps = None
+
+        self._monitors = []
+        self._poll_source = None
+        self._debounce_source = None
+
+        self._running = False
+
+    @property
+    def files(self):
+        return list(self._files)
+
+    def watch(self, filepaths):
+        self.stop()
+
+        self._filepaths = list(filepaths)
+        self._files = list(self._filepaths)
+        for filepath in self._filepaths:
+            for sidecar in find_sidecar_files(filepath):
+                if sidecar not in self._files:
+                    self._files.append(sidecar)
+
+        self._stamps = {path: file_stamp(path) for path in self._files}
+
+        self.logger.debug(f"Watching {self._files}")
+
+        self.run()
+
+    def run(self):
+        if self._running or not self._filepaths:
+            return
+        self._running = True
+
+        needs_polling = False
+        directories = {os.path.dirname(path) for path in self._files}
+
+        for directory in directories:
+            monitor = self._monitor_directory(directory)
+            if monitor:
+                self._monitors.append(monitor)
+            else:
+                needs_polling = True
+
+        if needs_polling:
+            self.logger.info("Falling back to polling for file changes")
+            self._poll_source = GLib.timeout_add(self.poll_interval, self._poll)
+
+    def stop(self):
+        self._running = False
+
+        for monitor in self._monitors:
+            monitor.cancel()
+        self._monitors = []
+
+        if self._poll_source:
+            GLib.source_remove(self._poll_source)
+            self._poll_source = None
+
+        if self._debounce_source:
+            GLib.source_remove(self._debounce_source)
+            self._debounce_source = None
+
+        self._pending_stamps = None
+
+    def _monitor_directory(self, directory):
+        gfile = Gio.File.new_for_path(directory)
+
+        # Network filesystems usually don't emit events, so poll them
+        try:
+            info = gfile.query_filesystem_info(
+                Gio.FILE_ATTRIBUTE_FILESYSTEM_REMOTE, None
+            )
+            if info.get_attribute_boolean(Gio.FILE_ATTRIBUTE_FILESYSTEM_REMOTE):
+                return None
+        except GLib.Error:
+            pass
+
+        try:
+            monitor = gfile.monitor_directory(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        except GLib.Error as e:
+            self.logger.warning(f"Couldn't monitor {directory}: {e}")
+            return None
+
+        monitor.connect("changed", self._on_monitor_changed)
+        return monitor
+
+    def _on_monitor_changed(self, monitor, file, other_file, event_type):
+        if event_type not in WATCHED_EVENTS:
+            return
+
+        paths = [file.get_path()]
+        if other_file:
+            paths.append(other_file.get_path())
+
+        if any(path in self._files for path in paths):
+            self._schedule_check()
+
+    def _poll(self):
+        if not self._running:
+            self._poll_source = None
+            return False
+
+        if self._changed_files(self._stamps):
+            self._schedule_check()
+
+        return True
+
+    def _schedule_check(self):
+        if not self._running:
+            return
+
+        if self._debounce_source:
+            GLib.source_remove(self._debounce_source)
+
+        self._pending_stamps = {path: file_stamp(path) for path in self._files}
+        self._debounce_source = GLib.timeout_add(self.debounce, self._on_debounce)
+
+    def _on_debounce(self):
+        self._debounce_source = None
+
+        # The files are still being written, wait for another quiet period
+        if self._changed_files(self._pending_stamps):
+            self._schedule_check()
+            return False
+
+        self._pending_stamps = None
+
+        changed = self._changed_files(self._stamps)
+        if not changed:
+            return False
+
+        for path in changed:
+            self._stamps[path] = file_stamp(path)
+
+        # A deleted file is usually replaced right away, wait until it's back
+        if any(file_stamp(path) is None for path in self._filepaths):
+            return False
+
+        self.logger.debug(f"Files changed: {changed}")
+        self.emit("changed", changed)
+
+        return False
+
+    def _changed_files(self, stamps):
+        return [path for path in self._files if file_stamp(path) != stamps.get(path)]
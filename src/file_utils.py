@@ -0,0 +1,44 @@
+# file_utils.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import hashlib
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_stamp(filepath):
+    try:
+        stat = os.stat(filepath)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def content_hash(*filepaths):
+    digest = hashlib.blake2b(digest_size=20)
+    for filepath in filepaths:
+        digest.update(filepath.encode())
+        try:
+            with open(filepath, "rb") as file:
+                while chunk := file.read(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+        except OSError:
+            digest.update(b"\0missing")
+    return digest.hexdigest()
@@ -0,0 +1,322 @@
+# frame_export.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import math
+import queue
+import tempfile
+import threading
+import subprocess
+
+from gettext import gettext as _
+
+from gi.repository import GLib
+
+from .image_export import (
+    ImageExporter,
+    ExportRequest,
+    ExportError,
+    SUPPORTED_EXTENSIONS,
+    to_wand_image,
+)
+from .vector_math import v_add, v_sub, v_norm, v_lerp, v_rotate
+
+MODE_TURNTABLE = "turntable"
+MODE_ANIMATION = "animation"
+MODE_CAMERA_PATH = "camera-path"
+
+# These are encoded by FFmpeg, any other format is saved as one image per frame
+VIDEO_EXTENSIONS = ("mp4", "mkv", "mov", "webm", "gif")
+
+# Rendered frames waiting to be written, rendering waits when the writer
+#   falls behind so the frames are never all in memory
+QUEUE_SIZE = 4
+
+
+def get_sequence_path(output, index):
+    base, extension = os.path.splitext(output)
+    return f"{base}_{index + 1:05d}{extension}"
+
+
+class FrameExportRequest(ExportRequest):
+    def __init__(
+        self,
+        output,
+        filepaths,
+        options,
+        camera_state,
+        mode,
+        frame_count=120,
+        frame_rate=30.0,
+        up_direction=(0.0, 0.0, 1.0),
+        time_range=(0.0, 0.0),
+        keyframes=(),
+        **kwargs,
+    ):
+        super().__init__(output, filepaths, options, camera_state, **kwargs)
+
+        self.mode = mode
+        self.frame_rate = frame_rate
+        self.up_direction = v_norm(up_direction)
+        self.time_range = time_range
+        self.keyframes = list(keyframes)
+
+        # The animation is exported in real time
+        if mode == MODE_ANIMATION:
+            lower, upper = time_range
+            frame_count = max(2, round((upper - lower) * frame_rate) + 1)
+        self.frame_count = frame_count
+
+    def get_animation_time(self, index):
+        lower, upper = self.time_range
+        return lower + (upper - lower) * index / (self.frame_count - 1)
+
+    # Returns the position, focal point, view up and view angle of a frame
+    def get_camera(self, index):
+        state = self.camera_state
+
+        if self.mode == MODE_TURNTABLE:
+            angle = 2 * math.pi * index / self.frame_count
+            offset = v_sub(state.position, state.focal_point)
+            return (
+                v_add(state.focal_point, v_rotate(offset, self.up_direction, angle)),
+                state.focal_point,
+                v_rotate(state.view_up, self.up_direction, angle),
+                state.view_angle,
+            )
+
+        if self.mode == MODE_CAMERA_PATH:
+            # The views are evenly spaced along the path
+            t = index / (self.frame_count - 1) * (len(self.keyframes) - 1)
+            segment = min(int(t), len(self.keyframes) - 2)
+            t -= segment
+
+            start = self.keyframes[segment]
+            end = self.keyframes[segment + 1]
+            return (
+                v_lerp(start.position, end.position, t),
+                v_lerp(start.focal_point, end.focal_point, t),
+                v_norm(v_lerp(start.view_up, end.view_up, t)),
+                start.view_angle + (end.view_angle - start.view_angle) * t,
+            )
+
+        return (state.position, state.focal_point, state.view_up, state.view_angle)
+
+    def __repr__(self):
+        return (
+            f"<FrameExportRequest {self.output}: {self.mode}, {self.frame_count}"
+            f" frames, {self.width}x{self.height} x{self.supersampling}>"
+        )
+
+
+class ImageSequenceWriter:
+    def __init__(self, request):
+        self.request = request
+
+    def write(self, index, image):
+        request = self.request
+        with to_wand_image(image, request.width, request.height) as wand_image:
+            wand_image.save(filename=get_sequence_path(request.output, index))
+
+    def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class FFmpegWriter:
+    """Pipes the raw frames to FFmpeg, which flips and scales them down."""
+
+    def __init__(self, ffmpeg, request):
+        self.ffmpeg = ffmpeg
+        self.request = request
+
+        self._process = None
+        self._log = tempfile.TemporaryFile()
+
+    # FFmpeg is started with the first frame, when the pixel format is known
+    def _start(self, image):
+        request = self.request
+
+        # Most encoders need an even size for yuv420p
+        width, height = request.width, request.height
+        output_options = []
+        if not request.output.lower().endswith(".gif"):
+            width, height = width - width % 2, height - height % 2
+            output_options = ["-pix_fmt", "yuv420p"]
+
+        self._process = subprocess.Popen(
+            [
+                self.ffmpeg,
+                "-y",
+                "-loglevel",
+                "error",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgba" if image.channel_count == 4 else "rgb24",
+                "-s",
+                f"{image.width}x{image.height}",
+                "-r",
+                str(request.frame_rate),
+                "-i",
+                "-",
+                "-vf",
+                f"vflip,scale={width}:{height}:flags=area",
+                *output_options,
+                request.output,
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self._log,
+        )
+
+    def write(self, index, image):
+        if self._process is None:
+            self._start(image)
+
+        try:
+            self._process.stdin.write(bytes(image.content))
+        except BrokenPipeError:
+            self._process.wait()
+            raise ExportError(self._read_log())
+
+    def close(self):
+        if self._process is None:
+            return
+
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise ExportError(self._read_log())
+        self._log.close()
+
+    def abort(self):
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        self._log.close()
+
+    def _read_log(self):
+        self._log.seek(0)
+        lines = self._log.read().decode(errors="replace").strip().splitlines()
+        return lines[-1] if lines else _("FFmpeg failed")
+
+
+class FrameExporter(ImageExporter):
+    """Renders frames along a camera path or the animation with an
+    offscreen engine, while another thread writes the frames rendered
+    before them."""
+
+    __gtype_name__ = "FrameExporter"
+
+    def _export(self, request):
+        writer = self._create_writer(request)
+
+        if request.mode == MODE_CAMERA_PATH and len(request.keyframes) < 2:
+            raise ExportError(_("A camera path needs at least two views"))
+
+        request.fit_single_pass()
+        # Loading, every frame and finishing the file
+        steps = request.frame_count + 2
+
+        engine = self._load_scene(request)
+        self._report(1, steps)
+
+        window = engine.window
+        window.size = (
+            request.width * request.supersampling,
+            request.height * request.supersampling,
+        )
+        window.camera.state = request.camera_state
+        self._match_view(window, request, request.height * request.supersampling)
+
+        frames = queue.Queue(maxsize=QUEUE_SIZE)
+        errors = []
+        thread = threading.Thread(
+            target=self._write_frames,
+            args=(writer, frames, errors, steps),
+            daemon=True,
+        )
+        thread.start()
+
+        try:
+            for index in range(request.frame_count):
+                self._check_cancelled()
+                if errors:
+                    break
+                frames.put((index, self._render_frame(engine, request, index)))
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            frames.put(None)
+            thread.join()
+
+        if errors:
+            writer.abort()
+            raise errors[0]
+
+        writer.close()
+        self._report(steps, steps)
+
+    def _create_writer(self, request):
+        extension = os.path.splitext(request.output)[1][1:].lower()
+
+        if extension in VIDEO_EXTENSIONS:
+            ffmpeg = GLib.find_program_in_path("ffmpeg")
+            if ffmpeg is None:
+                raise ExportError(_("FFmpeg is needed to export videos"))
+            return FFmpegWriter(ffmpeg, request)
+
+        if extension in SUPPORTED_EXTENSIONS:
+            return ImageSequenceWriter(request)
+
+        raise ExportError(_("Unsupported image format"))
+
+    def _render_frame(self, engine, request, index):
+        if request.mode == MODE_ANIMATION:
+            engine.scene.load_animation_time(request.get_animation_time(index))
+        else:
+            position, focal_point, view_up, view_angle = request.get_camera(index)
+            camera = engine.window.camera
+            camera.position = position
+            camera.focal_point = focal_point
+            camera.view_up = view_up
+            camera.view_angle = view_angle
+
+        return engine.window.render_to_image()
+
+    # After a failure the frames are still taken, so rendering never waits
+    #   on a full queue
+    def _write_frames(self, writer, frames, errors, steps):
+        while True:
+            frame = frames.get()
+            if frame is None:
+                return
+            if errors:
+                continue
+
+            index, image = frame
+            try:
+                writer.write(index, image)
+            except Exception as e:
+                errors.append(e)
+            else:
+                self._report(index + 2, steps)
@@ -0,0 +1,320 @@
+# image_export.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import math
+import threading
+
+from gettext import gettext as _
+
+from gi.repository import GLib, GObject
+
+from . import logger_lib
+from . import tracing
+from .engine_pool import create_engine
+
+# Largest image rendered in a single pass, OpenGL 4 guarantees render
+#   buffers of at least 16384 pixels but drivers often fail to allocate
+#   them, so bigger images are rendered in tiles
+MAX_TILE_SIZE = 8192
+
+# Images are encoded by ImageMagick, the format comes from the extension
+SUPPORTED_EXTENSIONS = ("png", "jpg", "jpeg", "exr", "tif", "tiff", "webp", "bmp")
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def get_tiles(width, height, tile_size):
+    tiles = []
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            tiles.append(
+                (
+                    left,
+                    top,
+                    min(tile_size, width - left),
+                    min(tile_size, height - top),
+                )
+            )
+    return tiles
+
+
+# World units covered by the height of an orthographic view at the focal
+#   point, the zoom of orthographic cameras isn't part of the camera state
+#   so exports are zoomed to match this
+def get_view_height(window, height):
+    camera = window.camera
+    focal_point = window.get_display_from_world(camera.focal_point)
+    origin = window.get_world_from_display(focal_point)
+    next_pixel = window.get_world_from_display(
+        (focal_point[0], focal_point[1] + 1, focal_point[2])
+    )
+    return math.dist(origin, next_pixel) * height
+
+
+# Supersampled images are scaled down to the given size
+def to_wand_image(image, width, height):
+    from wand.image import Image
+
+    pixel_format = "rgba" if image.channel_count == 4 else "rgb"
+    wand_image = Image(
+        blob=bytes(image.content),
+        format=pixel_format,
+        width=image.width,
+        height=image.height,
+        depth=8,
+    )
+
+    # F3D images start from the bottom row
+    wand_image.flip()
+    if (image.width, image.height) != (width, height):
+        wand_image.resize(width, height, filter="box")
+
+    return wand_image
+
+
+class ExportRequest:
+    def __init__(
+        self,
+        output,
+        filepaths,
+        options,
+        camera_state,
+        animation_time=None,
+        width=1920,
+        height=1080,
+        supersampling=1,
+        view_height=None,
+    ):
+        self.output = output
+        self.filepaths = list(filepaths)
+        self.options = dict(options)
+        self.camera_state = camera_state
+        self.animation_time = animation_time
+        self.width = width
+        self.height = height
+        self.supersampling = supersampling
+        self.view_height = view_height
+
+    @property
+    def orthographic(self):
+        return bool(self.options.get("scene.camera.orthographic"))
+
+    # The size of the output tiles, each one is rendered supersampled in
+    #   a single pass
+    def get_tile_size(self):
+        if self.orthographic:
+            return MAX_TILE_SIZE // self.supersampling
+
+        # Tiles of a perspective view need an off-axis projection that
+        #   libf3d doesn't expose, so it has to fit in a single pass
+        if max(self.width, self.height) > MAX_TILE_SIZE:
+            raise ExportError(
+                _("Images larger than {} pixels need an orthographic view").format(
+                    MAX_TILE_SIZE
+                )
+            )
+        return self.fit_single_pass()
+
+    # The supersampling is lowered when the image wouldn't fit otherwise
+    def fit_single_pass(self):
+        if max(self.width, self.height) > MAX_TILE_SIZE:
+            raise ExportError(
+                _("Images larger than {} pixels can't be exported").format(
+                    MAX_TILE_SIZE
+                )
+            )
+
+        tile_size = MAX_TILE_SIZE // self.supersampling
+        while max(self.width, self.height) > tile_size:
+            self.supersampling -= 1
+            tile_size = MAX_TILE_SIZE // self.supersampling
+        return tile_size
+
+    def __repr__(self):
+        return (
+            f"<ExportRequest {self.output}: {self.width}x{self.height}"
+            f" x{self.supersampling}>"
+        )
+
+
+class ImageExporter(GObject.Object):
+    """Renders images with an offscreen engine on a thread, in tiles when
+    they are too big for a single pass, and encodes them on the same
+    thread so the window never waits for an export."""
+
+    __gtype_name__ = "ImageExporter"
+
+    __gsignals__ = {
+        "progress": (GObject.SignalFlags.RUN_FIRST, None, (float,)),
+        "finished": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+        "failed": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+    }
+
+    def __init__(self):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self._thread = None
+        self._cancelled = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def export(self, request):
+        if self.running:
+            return False
+
+        self._cancelled.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(request,), daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self, request):
+        self.logger.info(f"Exporting {request}")
+        try:
+            with tracing.span("export-image", output=request.output):
+                self._export(request)
+        except ExportCancelled:
+            self.logger.info(f"Cancelled {request}")
+            self._emit("failed", _("Export cancelled"))
+        except Exception as e:
+            self.logger.error(f"Couldn't export {request}: {e}")
+            self._emit("failed", str(e))
+        else:
+            self._emit("finished", request.output)
+
+    def _emit(self, signal, value):
+        GLib.idle_add(self.emit, signal, value)
+
+    def _export(self, request):
+        from wand.image import Image
+
+        extension = os.path.splitext(request.output)[1][1:].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise ExportError(_("Unsupported image format"))
+
+        tile_size = request.get_tile_size()
+        tiles = get_tiles(request.width, request.height, tile_size)
+        # Loading, every tile and encoding
+        steps = len(tiles) + 2
+
+        engine = self._load_scene(request)
+        self._report(1, steps)
+
+        with Image(width=request.width, height=request.height) as canvas:
+            for index, tile in enumerate(tiles):
+                self._check_cancelled()
+                with self._render_tile(engine, request, tile) as image:
+                    canvas.composite(image, left=tile[0], top=tile[1], operator="copy")
+                self._report(index + 2, steps)
+
+            self._check_cancelled()
+
+            temp_output = request.output + ".part"
+            canvas.format = "jpeg" if extension == "jpg" else extension
+            canvas.save(filename=temp_output)
+            os.replace(temp_output, request.output)
+
+        self._report(steps, steps)
+
+    def _load_scene(self, request):
+        engine = create_engine("automatic", request.options)
+        engine.scene.add(request.filepaths)
+        if request.animation_time is not None:
+            engine.scene.load_animation_time(request.animation_time)
+        return engine
+
+    def _render_tile(self, engine, request, tile):
+        left, top, width, height = tile
+        factor = request.supersampling
+
+        window = engine.window
+        camera = window.camera
+        window.size = (width * factor, height * factor)
+        camera.state = request.camera_state
+
+        zoom = self._match_view(window, request, height * factor)
+        if (width, height) != (request.width, request.height):
+            zoom *= self._frame_tile(window, request, tile)
+
+        image = window.render_to_image()
+
+        # The zoom isn't part of the camera state, undo it for the next tile
+        camera.zoom(1 / zoom)
+
+        return to_wand_image(image, width, height)
+
+    # Zooms orthographic views to show as much of the scene as the viewer
+    #   did, returns the zoom applied to the camera
+    def _match_view(self, window, request, window_height):
+        if not request.orthographic or not request.view_height:
+            return 1.0
+
+        window.render()
+        zoom = get_view_height(window, window_height) / request.view_height
+        window.camera.zoom(zoom)
+        return zoom
+
+    # Only for orthographic views, the tile shows the part of the view it
+    #   covers at the same scale the whole image would have, returns the
+    #   zoom applied to the camera
+    def _frame_tile(self, window, request, tile):
+        left, top, width, height = tile
+        camera = window.camera
+
+        # World units per pixel of the whole image, measured on the tile
+        #   with the whole view in it
+        window.render()
+        focal_point = window.get_display_from_world(camera.focal_point)
+        origin = window.get_world_from_display(focal_point)
+        next_pixel = window.get_world_from_display(
+            (focal_point[0] + 1, focal_point[1], focal_point[2])
+        )
+        window_height = height * request.supersampling
+        pixel_size = math.dist(origin, next_pixel) * window_height / request.height
+
+        zoom = request.height / height
+        camera.zoom(zoom)
+
+        offset_x = left + width / 2 - request.width / 2
+        offset_y = request.height / 2 - (top + height / 2)
+        camera.pan(offset_x * pixel_size, offset_y * pixel_size)
+
+        return zoom
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise ExportCancelled()
+
+    def _report(self, step, steps):
+        GLib.idle_add(self.emit, "progress", step / steps)
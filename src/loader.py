@@ -0,0 +1,119 @@
+# loader.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import threading
+
+from gi.repository import GLib, GObject
+
+from . import logger_lib
+from . import tracing
+
+PHASE_READ = "read"
+PHASE_PARSE = "parse"
+PHASE_UPLOAD = "upload"
+PHASE_FIRST_FRAME = "first-frame"
+
+
+class LoadRequest:
+    def __init__(self, generation, kwargs):
+        self.generation = generation
+        self.kwargs = kwargs
+
+    @property
+    def filepath(self):
+        return self.kwargs.get("filepath") or ""
+
+    def __repr__(self):
+        return f"<LoadRequest {self.generation}: {self.kwargs}>"
+
+
+class FileLoader(GObject.Object):
+    """Runs load requests one at a time on a single worker thread.
+
+    Only one request can wait in the queue, submitting a new one replaces
+    it and cancels the one that is running."""
+
+    __gtype_name__ = "FileLoader"
+
+    __gsignals__ = {
+        "progress": (GObject.SignalFlags.RUN_FIRST, None, (str, str)),
+    }
+
+    def __init__(self, load_function):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self._load_function = load_function
+
+        self._condition = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, **kwargs):
+        with self._condition:
+            self._generation += 1
+            if self._pending:
+                self.logger.debug(f"Dropping stale {self._pending}")
+            self._pending = LoadRequest(self._generation, kwargs)
+            self._condition.notify()
+
+    def cancel(self):
+        with self._condition:
+            self._generation += 1
+            self._pending = None
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._condition.notify()
+
+    def is_cancelled(self, request):
+        return request.generation != self._generation
+
+    def report(self, request, phase, filepath=None):
+        GLib.idle_add(
+            self._emit_progress, request, phase, filepath or request.filepath
+        )
+
+    def _emit_progress(self, request, phase, filepath):
+        if not self.is_cancelled(request):
+            self.emit("progress", phase, filepath)
+        return False
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                request = self._pending
+                self._pending = None
+
+            try:
+                with tracing.span("load", filepath=request.filepath):
+                    self._load_function(request)
+            except Exception as e:
+                self.logger.error(f"Error while running {request}: {e}")
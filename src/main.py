@@ -19,11 +19,19 @@
 
 import sys
 import os
+import time
+import resource
+import functools
 import webbrowser
-import f3d
+
+# Imported first, it measures the startup
+from . import startup
+from . import tracing
 
 from gi.repository import Gtk, Gio, Adw, GLib
-from .window import Viewer3dWindow
+from .configurations import ConfigurationRegistry
+from .engine_pool import EnginePool
+from .scene_cache import SceneCache, clear_caches
 
 from gettext import gettext as _
 
@@ -42,9 +50,10 @@ class Viewer3dApplication(Adw.Application):
         )
 
         logger_lib.init()
+        self.logger = logger_lib.logger
 
-        self.lib_info = f3d.Engine.get_lib_info()
-        self.backends = f3d.Engine.get_rendering_backend_list()
+        # Parsed once for all the windows
+        self.configuration_registry = ConfigurationRegistry.get_default()
 
         self.create_action("quit", lambda *_: self.quit(), ["<primary>q"])
         self.create_action("about", self.on_about_action)
@@ -56,12 +65,14 @@ class Viewer3dApplication(Adw.Application):
         )
         self.create_action(
             "open-configs-folder",
-            lambda *_: webbrowser.open(self.props.active_window.configs_path),
+            lambda *_: webbrowser.open(
+                self.configuration_registry.user_configurations_path
+            ),
         )
 
         self.create_action(
             "open-new-window",
-            lambda *_: Viewer3dWindow(application=self).present(),
+            lambda *_: self.window_class(application=self).present(),
             ["<primary><shift>n"],
         )
         self.create_action(
@@ -69,6 +80,11 @@ class Viewer3dApplication(Adw.Application):
             lambda *_: self.props.active_window.open_with_external_app(),
             ["<primary><shift>e"],
         )
+        self.create_action("clear-cache", self.on_clear_cache_action)
+
+        self.set_accels_for_action("win.next-file", ["<alt>Right"])
+        self.set_accels_for_action("win.previous-file", ["<alt>Left"])
+        self.set_accels_for_action("win.performance-hud", ["<primary><shift>p"])
 
         user_home_dir = os.environ.get("XDG_CONFIG_HOME", os.environ["HOME"])
         show_image_external_action = Gio.SimpleAction.new_stateful(
@@ -90,11 +106,94 @@ class Viewer3dApplication(Adw.Application):
         self.update_theme()
         self.add_action(theme_action)
 
+        self.add_action(self.saved_settings.create_action("multi-file-open"))
+
+        self.update_scene_cache_size()
+        self.saved_settings.connect(
+            "changed::scene-cache-size", lambda *_: self.update_scene_cache_size()
+        )
+
+    # Only needed by the about dialog, F3D is asked the first time it opens
+    @functools.cached_property
+    def lib_info(self):
+        import f3d
+
+        return f3d.Engine.get_lib_info()
+
+    @functools.cached_property
+    def backends(self):
+        import f3d
+
+        return f3d.Engine.get_rendering_backend_list()
+
+    # The window module loads libf3d and its plugins, it's imported when the
+    #   first window is built, so a launch that hands its files to the running
+    #   instance never loads them
+    @functools.cached_property
+    def window_class(self):
+        from .window import Viewer3dWindow
+
+        startup.mark("window-imports")
+        return Viewer3dWindow
+
     def do_open(self, files, n_files, hint):
-        for file in files:
-            file_path = file.get_path()
-            win = Viewer3dWindow(application=self, startup_filepath=file_path)
-            win.present()
+        filepaths = [file.get_path() for file in files]
+        mode = self.saved_settings.get_string("multi-file-open")
+
+        if len(filepaths) > 1 and mode == "scene":
+            windows = [(filepaths[0], filepaths[1:])]
+        else:
+            windows = [(file_path, ()) for file_path in filepaths]
+
+        self.measure_open(len(filepaths), mode, len(windows))
+
+        # Every window takes an engine from the pool when its viewer is
+        #   initialized, the pool prepares them while the main loop is idle
+        if len(windows) > 1:
+            EnginePool.get_default().warm(len(windows))
+
+        # The first window shows right away, the others are built after
+        #   it and the pooled engines, when nothing else is waiting
+        self.open_window(*windows[0])
+        for file_path, extra_filepaths in windows[1:]:
+            GLib.idle_add(
+                self.open_window,
+                file_path,
+                extra_filepaths,
+                priority=GLib.PRIORITY_LOW,
+            )
+
+    def open_window(self, file_path, extra_filepaths=()):
+        win = self.window_class(
+            application=self,
+            startup_filepath=file_path,
+            extra_filepaths=extra_filepaths,
+        )
+        win.f3d_viewer.connect("first-frame", self.on_opened_first_frame)
+        win.present()
+        return GLib.SOURCE_REMOVE
+
+    # Startup is measured until every window opened together has rendered
+    #   its file, windows that fail to load are not waited for
+    def measure_open(self, file_count, mode, window_count):
+        self._open_start_time = time.perf_counter()
+        self._open_file_count = file_count
+        self._open_mode = mode
+        self._open_windows = window_count
+
+    def on_opened_first_frame(self, f3d_viewer, _elapsed):
+        f3d_viewer.disconnect_by_func(self.on_opened_first_frame)
+
+        self._open_windows -= 1
+        if self._open_windows != 0:
+            return
+
+        elapsed = (time.perf_counter() - self._open_start_time) * 1000
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.logger.info(
+            f"Opened {self._open_file_count} files as {self._open_mode} and "
+            f"rendered them in {elapsed:.1f} ms, peak memory {max_rss:.1f} MiB"
+        )
 
     def show_image_external(self, _action, image_path: GLib.Variant, *args):
         try:
@@ -156,6 +255,14 @@ class Viewer3dApplication(Adw.Application):
     def on_help_action(self, *args):
         Gio.AppInfo.launch_default_for_uri("help:exhibit")
 
+    def on_clear_cache_action(self, *args):
+        clear_caches()
+        self.props.active_window.send_toast(_("Cache cleared"))
+
+    def update_scene_cache_size(self):
+        size = self.saved_settings.get_int("scene-cache-size")
+        SceneCache.get_default().max_size = size * 1024 * 1024
+
     def on_theme_setting_changed(self, action, state):
         action.set_state(state)
         self.saved_settings.set_string("theme", state.get_string())
@@ -175,11 +282,11 @@ class Viewer3dApplication(Adw.Application):
         win = self.props.active_window
         if not win:
             if self.open_filepath:
-                win = Viewer3dWindow(
+                win = self.window_class(
                     application=self, startup_filepath=self.open_filepath
                 )
             else:
-                win = Viewer3dWindow(application=self)
+                win = self.window_class(application=self)
         win.present()
 
     def create_action(self, name, callback, shortcuts=None, *args):
@@ -195,5 +302,21 @@ class Viewer3dApplication(Adw.Application):
 
 def main(version):
     """The application's entry point."""
-    app = Viewer3dApplication()
-    return app.run(sys.argv)
+    if len(sys.argv) > 1 and sys.argv[1] == "--render":
+        from .batch_render import main as batch_render
+
+        return batch_render(sys.argv[2:])
+
+    argv = list(sys.argv)
+    if "--trace" in argv[1:-1]:
+        index = argv.index("--trace")
+        tracing.enable(argv[index + 1])
+        del argv[index : index + 2]
+    else:
+        tracing.enable_from_environment()
+
+    startup.mark("imports")
+    with tracing.span("application"):
+        app = Viewer3dApplication()
+    startup.mark("application")
+    return app.run(argv)
@@ -0,0 +1,321 @@
+# mesh_proxy.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sys
+import struct
+import tempfile
+import multiprocessing
+
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from gi.repository import GLib
+
+from . import logger_lib
+from . import tracing
+from .file_utils import content_hash
+from .model_formats import read_stl_triangle_count, STL_HEADER_SIZE
+from .vector_math import v_sub, v_cross, v_norm
+
+MESH_PROXIES_CACHE_DIRNAME = "mesh-proxies"
+
+# Cells along the longest side of the model, a proxy has at most a few
+#   triangles for every cell on its surface
+GRID_SIZE = 192
+
+# Triangles read at once from binary STL files
+READ_TRIANGLES = 64 * 1024
+
+STL_TRIANGLE = struct.Struct("<12fH")
+
+# The number of triangles of text files is estimated from their size
+BYTES_PER_TRIANGLE = {
+    "stl": 250,
+    "obj": 60,
+}
+
+
+# Proxies are built in another process, clustering holds the GIL for as long
+#   as it runs and would make the window stutter
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # Forking a process with GTK running isn't safe
+        _executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+def get_cache_path():
+    return os.path.join(GLib.get_user_cache_dir(), MESH_PROXIES_CACHE_DIRNAME)
+
+
+def estimate_triangle_count(filepath):
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    if extension not in BYTES_PER_TRIANGLE:
+        return 0
+
+    try:
+        if extension == "stl":
+            count = read_stl_triangle_count(filepath)
+            if count is not None:
+                return count
+        return os.path.getsize(filepath) // BYTES_PER_TRIANGLE[extension]
+    except OSError:
+        return 0
+
+
+def is_binary_stl(filepath):
+    return read_stl_triangle_count(filepath) is not None
+
+
+class VertexClustering:
+    """Merges the vertices that fall in the same cell of a grid into their
+    average, dropping the triangles that collapse."""
+
+    def __init__(self, lower, upper, grid_size=GRID_SIZE):
+        self.lower = lower
+        self.grid_size = grid_size
+        self.cell_size = max(max(v_sub(upper, lower)) / grid_size, 1e-12)
+
+        # Cell index to the sum of the vertices in it and their count
+        self.cells = {}
+        self.triangles = set()
+
+    # Takes the coordinates of the vertices one after the other and returns
+    #   the cells they fall in, the loop is inlined since it runs for every
+    #   vertex of the model
+    def add_vertices(self, coordinates):
+        lx, ly, lz = self.lower
+        scale = 1 / self.cell_size
+        grid_size = self.grid_size
+        last = grid_size - 1
+        cells = self.cells
+
+        result = []
+        for i in range(0, len(coordinates), 3):
+            x = coordinates[i]
+            y = coordinates[i + 1]
+            z = coordinates[i + 2]
+            cell = (
+                min(int((x - lx) * scale), last)
+                + (
+                    min(int((y - ly) * scale), last)
+                    + min(int((z - lz) * scale), last) * grid_size
+                )
+                * grid_size
+            )
+
+            sums = cells.get(cell)
+            if sums is None:
+                cells[cell] = [x, y, z, 1]
+            else:
+                sums[0] += x
+                sums[1] += y
+                sums[2] += z
+                sums[3] += 1
+            result.append(cell)
+
+        return result
+
+    # The triangle is rotated to start from its smallest cell, so that the
+    #   same triangle is only kept once without flipping it
+    def add_triangle(self, a, b, c):
+        if a == b or b == c or a == c:
+            return
+        if b < a and b < c:
+            a, b, c = b, c, a
+        elif c < a and c < b:
+            a, b, c = c, a, b
+        self.triangles.add((a, b, c))
+
+    def write_stl(self, file):
+        positions = {
+            cell: (sums[0] / sums[3], sums[1] / sums[3], sums[2] / sums[3])
+            for cell, sums in self.cells.items()
+        }
+
+        file.write(b"\0" * STL_HEADER_SIZE)
+        file.write(struct.pack("<I", len(self.triangles)))
+        for a, b, c in self.triangles:
+            p1, p2, p3 = positions[a], positions[b], positions[c]
+            normal = v_cross(v_sub(p2, p1), v_sub(p3, p1))
+            if any(normal):
+                normal = v_norm(normal)
+            file.write(STL_TRIANGLE.pack(*normal, *p1, *p2, *p3, 0))
+
+
+# The coordinates of the vertices of the triangles, in chunks
+def _binary_stl_coordinates(filepath):
+    with open(filepath, "rb") as file:
+        file.seek(STL_HEADER_SIZE + 4)
+        while chunk := file.read(READ_TRIANGLES * STL_TRIANGLE.size):
+            # Skip the normal and the attribute of every triangle
+            coordinates = array("f")
+            coordinates.frombytes(
+                b"".join(
+                    chunk[offset + 12 : offset + 48]
+                    for offset in range(0, len(chunk), STL_TRIANGLE.size)
+                )
+            )
+            if sys.byteorder == "big":
+                coordinates.byteswap()
+            yield coordinates
+
+
+def _ascii_stl_coordinates(filepath):
+    coordinates = []
+    with open(filepath, "r", errors="ignore") as file:
+        for line in file:
+            words = line.split()
+            if words and words[0] == "vertex":
+                coordinates += (float(words[1]), float(words[2]), float(words[3]))
+                if len(coordinates) >= READ_TRIANGLES * 9:
+                    yield coordinates
+                    coordinates = []
+    yield coordinates
+
+
+def _obj_coordinates(filepath):
+    coordinates = []
+    with open(filepath, "r", errors="ignore") as file:
+        for line in file:
+            if line.startswith("v "):
+                words = line.split()
+                coordinates += (float(words[1]), float(words[2]), float(words[3]))
+                if len(coordinates) >= READ_TRIANGLES * 9:
+                    yield coordinates
+                    coordinates = []
+    yield coordinates
+
+
+def _get_bounds(chunks):
+    lower = [float("inf")] * 3
+    upper = [float("-inf")] * 3
+    for coordinates in chunks:
+        for axis in range(3):
+            values = coordinates[axis::3]
+            if values:
+                lower[axis] = min(lower[axis], min(values))
+                upper[axis] = max(upper[axis], max(values))
+    if lower[0] > upper[0]:
+        raise ValueError("the file has no vertices")
+    return tuple(lower), tuple(upper)
+
+
+def _cluster_stl(filepath, chunks):
+    clustering = VertexClustering(*_get_bounds(chunks(filepath)))
+
+    for coordinates in chunks(filepath):
+        cells = clustering.add_vertices(coordinates)
+        for i in range(0, len(cells) - 2, 3):
+            clustering.add_triangle(cells[i], cells[i + 1], cells[i + 2])
+
+    return clustering
+
+
+# Polygons are split in fans of triangles, the cells of the vertices are
+#   kept in an array since faces can refer to any vertex before them
+def _cluster_obj(filepath):
+    clustering = VertexClustering(*_get_bounds(_obj_coordinates(filepath)))
+    vertex_cells = array("q")
+    coordinates = []
+
+    with open(filepath, "r", errors="ignore") as file:
+        for line in file:
+            if line.startswith("v "):
+                words = line.split()
+                coordinates += (float(words[1]), float(words[2]), float(words[3]))
+            elif line.startswith("f "):
+                if coordinates:
+                    vertex_cells.extend(clustering.add_vertices(coordinates))
+                    coordinates = []
+
+                cells = []
+                for word in line.split()[1:]:
+                    index = int(word.split("/")[0])
+                    index = index - 1 if index > 0 else len(vertex_cells) + index
+                    cells.append(vertex_cells[index])
+                for i in range(1, len(cells) - 1):
+                    clustering.add_triangle(cells[0], cells[i], cells[i + 1])
+
+    return clustering
+
+
+# Runs in a worker process, it must not use anything from GTK
+def build_mesh_proxy(filepath, proxy_path):
+    extension = os.path.splitext(filepath)[1][1:].lower()
+
+    if extension == "obj":
+        clustering = _cluster_obj(filepath)
+    elif is_binary_stl(filepath):
+        clustering = _cluster_stl(filepath, _binary_stl_coordinates)
+    else:
+        clustering = _cluster_stl(filepath, _ascii_stl_coordinates)
+
+    fd, temp_path = tempfile.mkstemp(suffix=".part", dir=os.path.dirname(proxy_path))
+    try:
+        with os.fdopen(fd, "wb") as file:
+            clustering.write_stl(file)
+        os.replace(temp_path, proxy_path)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+    return len(clustering.triangles)
+
+
+def get_mesh_proxy(filepath, threshold):
+    """Returns a simplified copy of a STL or OBJ model with more triangles
+    than threshold, built the first time it's needed and kept in the cache
+    by the content of the model, or None if the model doesn't need one."""
+
+    triangle_count = estimate_triangle_count(filepath)
+    if triangle_count <= threshold:
+        return None
+
+    cache_path = get_cache_path()
+    proxy_path = os.path.join(
+        cache_path, f"{content_hash(filepath)}-{GRID_SIZE}.stl"
+    )
+    if os.path.isfile(proxy_path):
+        return proxy_path
+
+    # Clustering takes a few microseconds for every triangle, so the first
+    #   proxy of the biggest models takes minutes
+    logger = logger_lib.logger
+    logger.info(f"Simplifying {filepath}, about {triangle_count} triangles")
+
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        with tracing.span("mesh-proxy", filepath=filepath):
+            future = _get_executor().submit(build_mesh_proxy, filepath, proxy_path)
+            triangles = future.result()
+    except (OSError, ValueError, IndexError, BrokenProcessPool) as e:
+        logger.warning(f"Couldn't simplify {filepath}: {e}")
+        return None
+
+    logger.info(f"Simplified {filepath} to {triangles} triangles")
+    return proxy_path
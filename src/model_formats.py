@@ -0,0 +1,131 @@
+# model_formats.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import struct
+
+STL_HEADER_SIZE = 80
+STL_TRIANGLE_SIZE = 50
+
+# Headers longer than this aren't PLY files
+PLY_MAX_HEADER_SIZE = 64 * 1024
+
+
+class PlyElement:
+    def __init__(self, name, count):
+        self.name = name
+        self.count = count
+        self.properties = []
+
+    def __repr__(self):
+        return f"<PlyElement {self.name}: {self.count} {self.properties}>"
+
+
+class PlyHeader:
+    def __init__(self, format, elements, header_size, comments=()):
+        self.format = format
+        self.elements = elements
+        self.header_size = header_size
+        # The comment and obj_info lines, like comment TextureFile
+        self.comments = list(comments)
+
+    @property
+    def is_ascii(self):
+        return self.format == "ascii"
+
+    def get_element(self, name):
+        for element in self.elements:
+            if element.name == name:
+                return element
+        return None
+
+    def count(self, name):
+        element = self.get_element(name)
+        return element.count if element else 0
+
+
+# Returns None if the file isn't a valid PLY file
+def read_ply_header(filepath):
+    format = None
+    elements = []
+    comments = []
+
+    with open(filepath, "rb") as file:
+        if file.readline().strip() != b"ply":
+            return None
+
+        while file.tell() < PLY_MAX_HEADER_SIZE:
+            line = file.readline()
+            if not line:
+                return None
+
+            words = line.decode("ascii", errors="replace").split()
+            if not words:
+                continue
+
+            match words[0]:
+                case "format":
+                    format = words[1]
+                case "comment" | "obj_info":
+                    comments.append(line.decode("ascii", errors="replace").strip())
+                case "element":
+                    elements.append(PlyElement(words[1], int(words[2])))
+                case "property" if elements:
+                    # property <type> <name> or property list <count> <type> <name>
+                    elements[-1].properties.append(tuple(words[1:]))
+                case "end_header":
+                    return PlyHeader(format, elements, file.tell(), comments)
+
+    return None
+
+
+# Returns None for ASCII STL files, counting their triangles needs reading
+#   the whole file
+def read_stl_triangle_count(filepath):
+    with open(filepath, "rb") as file:
+        header = file.read(STL_HEADER_SIZE + 4)
+
+    if len(header) < STL_HEADER_SIZE + 4:
+        return None
+
+    (count,) = struct.unpack("<I", header[STL_HEADER_SIZE:])
+    expected_size = STL_HEADER_SIZE + 4 + count * STL_TRIANGLE_SIZE
+    if os.path.getsize(filepath) != expected_size:
+        return None
+
+    return count
+
+
+# The number of points and faces of a file, read from its header when the
+#   format has one, None when they can't be known without parsing the file
+def count_elements(filepath):
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    try:
+        match extension:
+            case "ply":
+                header = read_ply_header(filepath)
+                if header:
+                    return header.count("vertex"), header.count("face")
+            case "stl":
+                triangles = read_stl_triangle_count(filepath)
+                if triangles is not None:
+                    return triangles * 3, triangles
+    except (OSError, ValueError, IndexError):
+        pass
+    return None, None
@@ -0,0 +1,190 @@
+# point_budget.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import math
+import hashlib
+import tempfile
+
+from gi.repository import GLib
+
+from . import logger_lib
+from . import tracing
+from .file_utils import file_stamp
+from .model_formats import read_ply_header
+
+POINT_CLOUDS_CACHE_DIRNAME = "point-clouds"
+
+# Records read at once when reducing a binary file
+READ_RECORDS = 64 * 1024
+
+PLY_TYPE_SIZES = {
+    "char": 1,
+    "int8": 1,
+    "uchar": 1,
+    "uint8": 1,
+    "short": 2,
+    "int16": 2,
+    "ushort": 2,
+    "uint16": 2,
+    "int": 4,
+    "int32": 4,
+    "uint": 4,
+    "uint32": 4,
+    "float": 4,
+    "float32": 4,
+    "double": 8,
+    "float64": 8,
+}
+
+
+def get_cache_path():
+    return os.path.join(GLib.get_user_cache_dir(), POINT_CLOUDS_CACHE_DIRNAME)
+
+
+# The size of a vertex in a binary file, None if it has list properties
+def get_record_size(element):
+    size = 0
+    for property in element.properties:
+        if property[0] == "list" or property[0] not in PLY_TYPE_SIZES:
+            return None
+        size += PLY_TYPE_SIZES[property[0]]
+    return size
+
+
+def _get_header(format, element, count):
+    lines = ["ply", f"format {format} 1.0", f"element vertex {count}"]
+    for property in element.properties:
+        lines.append("property " + " ".join(property))
+    lines.append("end_header")
+    return ("\n".join(lines) + "\n").encode("ascii")
+
+
+# Keeps one vertex every step, the points of a scan are spread evenly
+#   enough in the file for that to keep the shape of the cloud
+def _reduce_binary(source, target, element, step, count):
+    record_size = get_record_size(element)
+    kept = 0
+
+    while kept < count:
+        chunk = source.read(READ_RECORDS * step * record_size)
+        if not chunk:
+            break
+        records = [
+            chunk[offset : offset + record_size]
+            for offset in range(0, len(chunk), step * record_size)
+        ]
+        records = records[: count - kept]
+        target.write(b"".join(records))
+        kept += len(records)
+
+    return kept
+
+
+def _reduce_ascii(source, target, step, count):
+    kept = 0
+    for index, line in enumerate(source):
+        if index % step == 0:
+            target.write(line)
+            kept += 1
+            if kept == count:
+                break
+    return kept
+
+
+# Only point clouds stored with the vertices first can be reduced, the
+#   vertices of a mesh are referenced by its faces
+def can_reduce(header):
+    if header is None or not header.elements:
+        return False
+    if header.elements[0].name != "vertex" or header.count("face") > 0:
+        return False
+    return header.is_ascii or get_record_size(header.elements[0]) is not None
+
+
+def get_reduced_point_cloud(filepath, point_budget):
+    """Returns a copy of a PLY point cloud with at most point_budget points,
+    keeping one point every few, or None if the file doesn't need or can't
+    be reduced. The copy is built the first time it's needed, while the file
+    loads, and kept in the cache.
+
+    This is a single uniform reduction, the whole copy is loaded at once
+    whatever the distance of the camera."""
+
+    if os.path.splitext(filepath)[1].lower() != ".ply":
+        return None
+
+    try:
+        header = read_ply_header(filepath)
+    except (OSError, ValueError, IndexError):
+        return None
+
+    if not can_reduce(header) or header.count("vertex") <= point_budget:
+        return None
+
+    stamp = file_stamp(filepath)
+    path_hash = hashlib.sha1(filepath.encode()).hexdigest()[:16]
+    key_hash = hashlib.sha1(f"{stamp}:{point_budget}".encode()).hexdigest()[:16]
+
+    cache_path = get_cache_path()
+    reduced_path = os.path.join(cache_path, f"{path_hash}-{key_hash}.ply")
+    if os.path.isfile(reduced_path):
+        return reduced_path
+
+    element = header.elements[0]
+    total = header.count("vertex")
+    step = math.ceil(total / point_budget)
+    count = math.ceil(total / step)
+
+    logger = logger_lib.logger
+    logger.info(f"Reducing {filepath} from {total} to {count} points")
+
+    temp_path = None
+    try:
+        os.makedirs(cache_path, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".part", dir=cache_path)
+        with tracing.span("point-budget", filepath=filepath, points=count):
+            with open(filepath, "rb") as source, os.fdopen(fd, "wb") as target:
+                source.seek(header.header_size)
+                target.write(_get_header(header.format, element, count))
+                if header.is_ascii:
+                    kept = _reduce_ascii(source, target, step, count)
+                else:
+                    kept = _reduce_binary(source, target, element, step, count)
+
+        if kept != count:
+            raise ValueError(f"the file has {kept} points instead of {count}")
+
+        os.replace(temp_path, reduced_path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Couldn't reduce {filepath}: {e}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+    # Reductions of older versions of the file won't be used again
+    reduced_filename = os.path.basename(reduced_path)
+    for filename in os.listdir(cache_path):
+        if filename.startswith(path_hash) and filename != reduced_filename:
+            try:
+                os.remove(os.path.join(cache_path, filename))
+            except OSError:
+                pass
+
+    return reduced_path
@@ -0,0 +1,202 @@
+# prefetch.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import threading
+
+from collections import OrderedDict
+
+from gi.repository import GObject
+
+from . import logger_lib
+from . import tracing
+from .file_utils import file_stamp
+from .file_monitor import find_sidecar_files
+from .engine_pool import create_engine_from_thread
+
+# A parsed scene takes more memory than the file it comes from
+MEMORY_FACTOR = 3
+
+# Options that change how a file is loaded, a prefetched scene loaded with
+#   different ones can't be used
+LOAD_OPTIONS = ("scene.up_direction",)
+
+
+def list_directory_files(filepath, extensions):
+    directory = os.path.dirname(filepath)
+    try:
+        items = os.listdir(directory)
+    except OSError:
+        return []
+
+    files = []
+    for item in items:
+        extension = os.path.splitext(item)[1][1:].lower()
+        path = os.path.join(directory, item)
+        if extension in extensions and os.path.isfile(path):
+            files.append(path)
+
+    files.sort(key=lambda path: os.path.basename(path).lower())
+    return files
+
+
+def estimate_scene_size(filepath):
+    size = 0
+    for path in [filepath] + find_sidecar_files(filepath):
+        stamp = file_stamp(path)
+        if stamp:
+            size += stamp[1]
+    return size * MEMORY_FACTOR
+
+
+class PrefetchedScene:
+    # The stamp is the one taken before parsing, a file that changed while
+    #   it was parsed never matches it
+    def __init__(self, filepath, engine, options, size, stamp):
+        self.filepath = filepath
+        self.engine = engine
+        self.options = options
+        self.size = size
+        self.stamp = stamp
+
+    def is_valid_for(self, options):
+        if self.stamp != file_stamp(self.filepath):
+            return False
+        return all(self.options.get(key) == options.get(key) for key in LOAD_OPTIONS)
+
+    def __repr__(self):
+        return f"<PrefetchedScene {self.filepath}: {self.size} bytes>"
+
+
+class ScenePrefetcher(GObject.Object):
+    """Parses files into spare engines in the background so they can be
+    swapped into the viewer, keeping the parsed scenes in a LRU cache
+    bounded by a memory budget."""
+
+    __gtype_name__ = "ScenePrefetcher"
+
+    def __init__(self, engine_factory, memory_budget):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self.memory_budget = memory_budget
+
+        self._engine_factory = engine_factory
+
+        self._cache = OrderedDict()
+        self._cache_size = 0
+
+        self._condition = threading.Condition()
+        self._queue = []
+        self._wanted = []
+        self._stopped = False
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Takes a list of (filepath, options) in order of priority, replacing
+    #   the files that still have to be prefetched
+    def prefetch(self, requests):
+        with self._condition:
+            self._queue = list(requests)
+            self._wanted = [filepath for filepath, _options in self._queue]
+            self._condition.notify()
+
+    def take(self, filepath, options):
+        with self._condition:
+            prefetched = self._cache.pop(filepath, None)
+            if prefetched:
+                self._cache_size -= prefetched.size
+
+        if prefetched and prefetched.is_valid_for(options):
+            self.logger.info(f"Using {prefetched}")
+            return prefetched.engine
+
+        return None
+
+    def clear(self):
+        with self._condition:
+            self._queue = []
+            self._wanted = []
+            self._cache.clear()
+            self._cache_size = 0
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.clear()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                filepath, options = self._queue.pop(0)
+
+                prefetched = self._cache.get(filepath)
+                if prefetched and prefetched.is_valid_for(options):
+                    self._cache.move_to_end(filepath)
+                    continue
+
+            self._prefetch(filepath, options)
+
+    def _prefetch(self, filepath, options):
+        size = estimate_scene_size(filepath)
+        if size > self.memory_budget:
+            self.logger.debug(f"{filepath} is too big to be prefetched")
+            return
+
+        stamp = file_stamp(filepath)
+        try:
+            with tracing.span("prefetch", filepath=filepath):
+                # The engine is created by the main loop, only parsing
+                #   happens here
+                engine = create_engine_from_thread(self._engine_factory, options)
+                engine.scene.add(filepath)
+        except Exception as e:
+            self.logger.warning(f"Couldn't prefetch {filepath}: {e}")
+            return
+
+        prefetched = PrefetchedScene(filepath, engine, options, size, stamp)
+        self.logger.debug(f"Prefetched {prefetched}")
+
+        with self._condition:
+            old = self._cache.pop(filepath, None)
+            if old:
+                self._cache_size -= old.size
+
+            self._cache[filepath] = prefetched
+            self._cache_size += size
+
+            while self._cache_size > self.memory_budget:
+                evicted = self._cache.pop(self._eviction_candidate())
+                self._cache_size -= evicted.size
+                self.logger.debug(f"Evicted {evicted}")
+
+    # The least recently used file that is not wanted anymore, or the least
+    #   wanted one
+    def _eviction_candidate(self):
+        for filepath in self._cache:
+            if filepath not in self._wanted:
+                return filepath
+        return max(self._cache, key=self._wanted.index)
@@ -0,0 +1,88 @@
+# readers.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+
+from gi.repository import GLib
+
+from . import logger_lib
+
+READERS_CACHE_FILENAME = "readers.json"
+
+_allowed_extensions = None
+
+
+# libf3d is only imported when the readers aren't cached yet
+def get_f3d_version():
+    import f3d
+
+    return getattr(f3d, "__version__", None) or f3d.Engine.get_lib_info().version_full
+
+
+def _get_cache_path():
+    return os.path.join(GLib.get_user_cache_dir(), READERS_CACHE_FILENAME)
+
+
+def _read_cache(version):
+    try:
+        with open(_get_cache_path(), "r") as file:
+            cache = json.load(file)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+    if cache.get("version") != version:
+        return None
+    return cache.get("extensions")
+
+
+def _write_cache(version, extensions):
+    cache_path = _get_cache_path()
+    temp_path = cache_path + ".part"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(temp_path, "w") as file:
+            json.dump({"version": version, "extensions": extensions}, file)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        logger_lib.logger.warning(f"Couldn't cache the F3D readers: {e}")
+
+
+# The extensions supported by F3D, asked to F3D only the first time they are
+#   needed after F3D is updated
+def get_allowed_extensions():
+    global _allowed_extensions
+
+    if _allowed_extensions is not None:
+        return _allowed_extensions
+
+    version = get_f3d_version()
+    extensions = _read_cache(version)
+
+    if extensions is None:
+        import f3d
+
+        extensions = []
+        for reader in f3d.Engine.get_readers_info():
+            extensions += reader.extensions
+        _write_cache(version, extensions)
+        logger_lib.logger.debug(f"Queried the F3D readers of {version}")
+
+    _allowed_extensions = extensions
+    return _allowed_extensions
@@ -0,0 +1,92 @@
+# render_stats.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+
+from collections import deque
+
+CSV_COLUMNS = (
+    "file",
+    "configuration",
+    "frames",
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "renders_per_second",
+    "render_ms",
+    "options_ms",
+    "points",
+    "faces",
+)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class RenderStats:
+    """Rolling statistics of the last rendered frames and of the time spent
+    updating the options."""
+
+    def __init__(self, max_frames=300, rate_interval=2.0):
+        self.rate_interval = rate_interval
+
+        self._frames = deque(maxlen=max_frames)
+        self._option_updates = deque(maxlen=max_frames)
+
+    def add_frame(self, frame_time):
+        self._frames.append((time.monotonic(), frame_time))
+
+    def add_option_update(self, update_time):
+        self._option_updates.append((time.monotonic(), update_time))
+
+    def clear(self):
+        self._frames.clear()
+        self._option_updates.clear()
+
+    def get_summary(self):
+        frame_times = sorted(frame_time for _timestamp, frame_time in self._frames)
+
+        now = time.monotonic()
+        recent_frames = sum(
+            1
+            for timestamp, _frame_time in self._frames
+            if now - timestamp < self.rate_interval
+        )
+
+        # The option updates that happened while the kept frames were rendered
+        oldest = self._frames[0][0] if self._frames else now
+        options_time = sum(
+            update_time
+            for timestamp, update_time in self._option_updates
+            if timestamp >= oldest
+        )
+
+        return {
+            "frames": len(frame_times),
+            "p50_ms": percentile(frame_times, 0.50),
+            "p95_ms": percentile(frame_times, 0.95),
+            "p99_ms": percentile(frame_times, 0.99),
+            "renders_per_second": recent_frames / self.rate_interval,
+            "render_ms": sum(frame_times),
+            "options_ms": options_time,
+        }
@@ -0,0 +1,371 @@
+# scene_cache.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+import atexit
+import time
+import shutil
+import struct
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from gi.repository import GLib
+
+from . import logger_lib
+from . import tracing
+from . import mesh_proxy
+from . import point_budget
+from .file_utils import file_stamp
+from .model_formats import read_ply_header, read_stl_triangle_count, STL_HEADER_SIZE
+
+SCENES_CACHE_DIRNAME = "scenes"
+INDEX_FILENAME = "index.json"
+
+# Changing how files are converted makes the old conversions unusable
+CONVERSION_VERSION = 2
+
+PLY_STRUCT_TYPES = {
+    "char": "b",
+    "int8": "b",
+    "uchar": "B",
+    "uint8": "B",
+    "short": "h",
+    "int16": "h",
+    "ushort": "H",
+    "uint16": "H",
+    "int": "i",
+    "int32": "i",
+    "uint": "I",
+    "uint32": "I",
+    "float": "f",
+    "float32": "f",
+    "double": "d",
+    "float64": "d",
+}
+
+STL_TRIANGLE = struct.Struct("<12fH")
+
+
+def _parse(struct_type, word):
+    return float(word) if struct_type in "fd" else int(word)
+
+
+# The copy is in the cache, textures next to the model are found from its
+#   folder
+def _get_comment(comment, source_dir):
+    words = comment.split(maxsplit=2)
+    if len(words) == 3 and words[1] == "TextureFile":
+        return f"comment TextureFile {os.path.join(source_dir, words[2])}"
+    return comment
+
+
+# Every element is expected on its own line, like all the exporters do
+def convert_ascii_ply(header, source, target, source_dir):
+    lines = ["ply", "format binary_little_endian 1.0"]
+    lines += [_get_comment(comment, source_dir) for comment in header.comments]
+    for element in header.elements:
+        lines.append(f"element {element.name} {element.count}")
+        for property in element.properties:
+            lines.append("property " + " ".join(property))
+    lines.append("end_header")
+    target.write(("\n".join(lines) + "\n").encode("ascii"))
+
+    source.seek(header.header_size)
+    for element in header.elements:
+        scalars = all(property[0] != "list" for property in element.properties)
+        if scalars:
+            types = [PLY_STRUCT_TYPES[property[0]] for property in element.properties]
+            record = struct.Struct("<" + "".join(types))
+
+        for _index in range(element.count):
+            words = source.readline().split()
+            if scalars:
+                values = [_parse(t, word) for t, word in zip(types, words)]
+                target.write(record.pack(*values))
+                continue
+
+            data = bytearray()
+            position = 0
+            for property in element.properties:
+                if property[0] == "list":
+                    count_type = PLY_STRUCT_TYPES[property[1]]
+                    item_type = PLY_STRUCT_TYPES[property[2]]
+                    count = int(words[position])
+                    items = words[position + 1 : position + 1 + count]
+                    data += struct.pack("<" + count_type, count)
+                    data += struct.pack(
+                        f"<{count}{item_type}",
+                        *(_parse(item_type, word) for word in items),
+                    )
+                    position += 1 + count
+                else:
+                    struct_type = PLY_STRUCT_TYPES[property[0]]
+                    data += struct.pack(
+                        "<" + struct_type, _parse(struct_type, words[position])
+                    )
+                    position += 1
+            target.write(data)
+
+
+# The number of triangles is written at the end, when it's known
+def convert_ascii_stl(source, target):
+    target.write(b"\0" * STL_HEADER_SIZE + b"\0\0\0\0")
+
+    count = 0
+    values = []
+    for line in source:
+        words = line.split()
+        if not words:
+            continue
+        if words[0] == b"facet":
+            values = [float(word) for word in words[2:5]]
+        elif words[0] == b"vertex":
+            values += (float(words[1]), float(words[2]), float(words[3]))
+        elif words[0] == b"endfacet":
+            target.write(STL_TRIANGLE.pack(*values, 0))
+            count += 1
+
+    target.seek(STL_HEADER_SIZE)
+    target.write(struct.pack("<I", count))
+
+
+# The extension of the converted file, None if it's already fast to load
+def get_converted_extension(filepath):
+    extension = os.path.splitext(filepath)[1][1:].lower()
+    try:
+        match extension:
+            case "ply":
+                header = read_ply_header(filepath)
+                if header and header.is_ascii:
+                    return "ply"
+            case "stl":
+                if read_stl_triangle_count(filepath) is None:
+                    return "stl"
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# Runs in a worker process, it must not use anything from GTK
+def convert(filepath, extension, target_path):
+    with open(filepath, "rb") as source, open(target_path, "wb") as target:
+        if extension == "ply":
+            header = read_ply_header(filepath)
+            convert_ascii_ply(header, source, target, os.path.dirname(filepath))
+        else:
+            convert_ascii_stl(source, target)
+
+
+# Files are converted in another process, parsing them holds the GIL for as
+#   long as it runs and would make the window stutter
+_process_executor = None
+
+
+def _get_process_executor():
+    global _process_executor
+    if _process_executor is None:
+        # Forking a process with GTK running isn't safe
+        _process_executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_executor
+
+
+# Removes everything that can be built again from the models
+def clear_caches():
+    SceneCache.get_default().clear()
+    for path in (mesh_proxy.get_cache_path(), point_budget.get_cache_path()):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class SceneCache:
+    """Binary copies of the models in text formats, converted in a worker
+    process the first time they are opened and used instead of them the next times.
+
+    The copies are keyed by the path, mtime and size of the model and the
+    least recently used ones are removed above max_size bytes."""
+
+    _default = None
+
+    def __init__(self, max_size=2048 * 1024 * 1024):
+        self.logger = logger_lib.logger
+
+        self.max_size = max_size
+
+        self.cache_path = os.path.join(GLib.get_user_cache_dir(), SCENES_CACHE_DIRNAME)
+        self._index_path = os.path.join(self.cache_path, INDEX_FILENAME)
+
+        self._lock = threading.Lock()
+        self._index = self._read_index()
+        # The last uses are only kept in memory until the index is written
+        #   for a conversion or when the app quits
+        self._index_changed = False
+        self._pending = set()
+        self._failed = set()
+        # Waits for the conversions one at a time, and indexes them
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+        atexit.register(self.flush)
+
+    @classmethod
+    def get_default(cls):
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def get_key(self, filepath):
+        stamp = file_stamp(filepath)
+        if stamp is None:
+            return None
+        key = f"{CONVERSION_VERSION}:{filepath}:{stamp[0]}:{stamp[1]}"
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def lookup(self, filepath):
+        key = self.get_key(filepath)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.isfile(entry["path"]):
+                return None
+            entry["used"] = time.time()
+            self._index_changed = True
+            return entry["path"]
+
+    # Converts the file on a thread if it's worth it, it will be used the
+    #   next time it's opened
+    def request(self, filepath):
+        key = self.get_key(filepath)
+        if key is None:
+            return
+
+        with self._lock:
+            if key in self._index or key in self._pending or key in self._failed:
+                return
+            self._pending.add(key)
+
+        self._executor.submit(self._convert, filepath, key)
+
+    def flush(self):
+        with self._lock:
+            if self._index_changed:
+                self._write_index()
+
+    def clear(self):
+        with self._lock:
+            self._index = {}
+            self._index_changed = False
+            self._failed = set()
+            shutil.rmtree(self.cache_path, ignore_errors=True)
+
+    def get_size(self):
+        with self._lock:
+            return sum(entry["size"] for entry in self._index.values())
+
+    def _convert(self, filepath, key):
+        extension = get_converted_extension(filepath)
+        if extension is None:
+            with self._lock:
+                self._pending.discard(key)
+                self._failed.add(key)
+            return
+
+        target_path = os.path.join(self.cache_path, f"{key}.{extension}")
+        temp_path = None
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix=".part", dir=self.cache_path)
+            os.close(fd)
+            with tracing.span("scene-cache", filepath=filepath):
+                _get_process_executor().submit(
+                    convert, filepath, extension, temp_path
+                ).result()
+            os.replace(temp_path, target_path)
+        except (
+            OSError,
+            ValueError,
+            IndexError,
+            KeyError,
+            struct.error,
+            BrokenProcessPool,
+        ) as e:
+            self.logger.warning(f"Couldn't convert {filepath}: {e}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            with self._lock:
+                self._pending.discard(key)
+                self._failed.add(key)
+            return
+
+        self.logger.info(f"Converted {filepath} to binary")
+
+        with self._lock:
+            self._pending.discard(key)
+            self._index[key] = {
+                "source": filepath,
+                "path": target_path,
+                "size": os.path.getsize(target_path),
+                "used": time.time(),
+            }
+            self._evict()
+            self._write_index()
+
+    # Removes the least recently used copies and the ones of files that
+    #   changed since they were converted
+    def _evict(self):
+        for key, entry in list(self._index.items()):
+            if self.get_key(entry["source"]) != key:
+                self._remove(key)
+
+        entries = sorted(self._index.items(), key=lambda item: item[1]["used"])
+        size = sum(entry["size"] for _key, entry in entries)
+        for key, entry in entries:
+            if size <= self.max_size:
+                break
+            size -= entry["size"]
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._index.pop(key)
+        try:
+            os.remove(entry["path"])
+            self.logger.debug(f"Evicted the binary copy of {entry['source']}")
+        except OSError:
+            pass
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self):
+        temp_path = self._index_path + ".part"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(self._index, file, indent=4)
+            os.replace(temp_path, self._index_path)
+            self._index_changed = False
+        except OSError as e:
+            self.logger.warning(f"Couldn't write the scene cache index: {e}")
@@ -21,6 +21,7 @@
 from gi.repository import Gio, GObject
 
 from enum import IntEnum
+from contextlib import contextmanager
 
 from . import logger_lib
 
@@ -109,6 +110,7 @@ class WindowSettings(Gio.ListStore):
         "changed-view": (GObject.SignalFlags.RUN_FIRST, None, (Setting,)),
         "changed-other": (GObject.SignalFlags.RUN_FIRST, None, (Setting,)),
         "changed-internal": (GObject.SignalFlags.RUN_FIRST, None, (Setting,)),
+        "changed-batch": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
     }
 
     default_settings = {
@@ -169,51 +171,88 @@ class WindowSettings(Gio.ListStore):
 
         self.logger = logger_lib.logger
 
+        # Settings by name, and dictionaries of the values of each type
+        #   built on demand and dropped when one of the values changes
+        self._index = {}
+        self._snapshots = {}
+
+        # Settings changed inside a transaction, by name
+        self._transaction_depth = 0
+        self._pending_changes = {}
+
         for name, value in self.default_settings.items():
             setting = Setting(name, value, SettingType.VIEW)
             setting.connect("changed", self.on_view_setting_changed)
             setting.connect("changed-no-ui-update", self.on_other_setting_changed)
             self.append(setting)
+            self._index[name] = setting
 
         for name, value in self.other_settings.items():
             setting = Setting(name, value, SettingType.OTHER)
             setting.connect("changed", self.on_other_setting_changed)
             setting.connect("changed-no-ui-update", self.on_other_setting_changed)
             self.append(setting)
+            self._index[name] = setting
 
         for name, value in self.internal_settings.items():
             setting = Setting(name, value, SettingType.INTERNAL)
             setting.connect("changed", self.on_internal_setting_changed)
             setting.connect("changed-no-ui-update", self.on_other_setting_changed)
             self.append(setting)
+            self._index[name] = setting
 
     def sync_all_settings(self):
-        for setting in self:
-            setting.emit("changed", setting.name, setting.type)
+        with self.transaction():
+            for setting in self:
+                setting.emit("changed", setting.name, setting.type)
+
+    # Inside a transaction the settings still update their UI, but instead
+    #   of a changed signal for each of them a single changed-batch with
+    #   all the changed settings is emitted at the end
+    @contextmanager
+    def transaction(self):
+        self._transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0 and self._pending_changes:
+                settings = list(self._pending_changes.values())
+                self._pending_changes = {}
+                self.emit("changed-batch", settings)
+
+    def _defer_change(self, setting):
+        self._snapshots.pop(setting.type, None)
+        if self._transaction_depth == 0:
+            return False
+        self._pending_changes[setting.name] = setting
+        return True
 
     def on_view_setting_changed(self, setting, name, enum):
-        self.emit("changed-view", setting)
+        if not self._defer_change(setting):
+            self.emit("changed-view", setting)
 
     def on_other_setting_changed(self, setting, name, enum):
-        self.emit("changed-other", setting)
+        if not self._defer_change(setting):
+            self.emit("changed-other", setting)
 
     def on_internal_setting_changed(self, setting, name, enum):
-        self.emit("changed-internal", setting)
+        if not self._defer_change(setting):
+            self.emit("changed-internal", setting)
 
     def set_setting(self, key, val, update=True):
-        for index, setting in enumerate(self):
-            if key == setting.name:
-                if update:
-                    setting.set_value(val)
-                else:
-                    setting.set_value_without_ui_update(val)
-                return
-        self.logger.warning(f"{key} key not present")
+        setting = self._index.get(key)
+        if setting is None:
+            self.logger.warning(f"{key} key not present")
+            return
+
+        if update:
+            setting.set_value(val)
+        else:
+            setting.set_value_without_ui_update(val)
 
     def get_setting(self, key):
-        for setting in self:
-            if key == setting.name:
-                return setting
+        return self._index.get(key)
 
     def get_default_user_customizable_settings(self):
         settings = self.default_settings.copy()
@@ -230,18 +269,20 @@ class WindowSettings(Gio.ListStore):
             self.set_setting(key, value)
 
     def get_view_settings(self):
-        options = {}
-        for setting in self:
-            if setting.type == SettingType.VIEW:
-                options[setting.name] = setting.value
-        return options
+        return dict(self._get_snapshot(SettingType.VIEW))
 
     def get_other_settings(self):
-        options = {}
-        for setting in self:
-            if setting.type == SettingType.OTHER:
-                options[setting.name] = setting.value
-        return options
+        return dict(self._get_snapshot(SettingType.OTHER))
+
+    def _get_snapshot(self, setting_type):
+        snapshot = self._snapshots.get(setting_type)
+        if snapshot is None:
+            snapshot = {}
+            for setting in self:
+                if setting.type == setting_type:
+                    snapshot[setting.name] = setting.value
+            self._snapshots[setting_type] = snapshot
+        return snapshot
 
     def __repr__(self):
         out = ""
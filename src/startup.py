@@ -0,0 +1,57 @@
+# startup.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+
+from . import logger_lib
+from . import tracing
+
+# Startup is measured from when this module is first imported
+_start_time = time.perf_counter()
+_last_time = _start_time
+_phases = []
+_finished = False
+
+
+def mark(phase):
+    global _last_time
+
+    if _finished:
+        return
+
+    now = time.perf_counter()
+    _phases.append((phase, (now - _last_time) * 1000))
+    _last_time = now
+
+    tracing.instant(f"startup {phase}")
+
+
+# Logs the time taken by each phase, only the first time it's called
+def finish(phase):
+    global _finished
+
+    if _finished:
+        return
+
+    mark(phase)
+    _finished = True
+
+    total = (_last_time - _start_time) * 1000
+    phases = ", ".join(f"{name} {elapsed:.1f} ms" for name, elapsed in _phases)
+    logger_lib.logger.info(f"Startup took {total:.1f} ms: {phases}")
@@ -0,0 +1,90 @@
+# texture_cache.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import Gdk, GLib
+
+from . import logger_lib
+from .file_utils import file_stamp
+
+
+class TextureCache:
+    """Decoded textures shared by all the windows, the images are decoded
+    on a thread the first time they are needed."""
+
+    _default = None
+
+    def __init__(self, max_textures=256):
+        self.logger = logger_lib.logger
+
+        self.max_textures = max_textures
+
+        self._textures = OrderedDict()
+        self._callbacks = {}
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    @classmethod
+    def get_default(cls):
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def lookup(self, filepath):
+        key = (filepath, file_stamp(filepath))
+        texture = self._textures.get(key)
+        if texture:
+            self._textures.move_to_end(key)
+        return texture
+
+    # Calls callback(texture) on the main thread, texture is None on failure
+    def load_async(self, filepath, callback):
+        texture = self.lookup(filepath)
+        if texture:
+            callback(texture)
+            return
+
+        key = (filepath, file_stamp(filepath))
+        if key in self._callbacks:
+            self._callbacks[key].append(callback)
+            return
+
+        self._callbacks[key] = [callback]
+        future = self._executor.submit(Gdk.Texture.new_from_filename, filepath)
+        future.add_done_callback(
+            lambda future: GLib.idle_add(self._on_loaded, key, future)
+        )
+
+    def _on_loaded(self, key, future):
+        try:
+            texture = future.result()
+        except Exception as e:
+            self.logger.warning(f"Couldn't decode {key[0]}: {e}")
+            texture = None
+
+        if texture:
+            self._textures[key] = texture
+            while len(self._textures) > self.max_textures:
+                self._textures.popitem(last=False)
+
+        for callback in self._callbacks.pop(key, []):
+            callback(texture)
+
+        return False
@@ -0,0 +1,201 @@
+# thumbnail_cache.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+
+from gi.repository import GLib, GObject
+
+from . import logger_lib
+from . import tracing
+from .file_utils import file_stamp, content_hash
+
+INDEX_FILENAME = "index.json"
+THUMBNAIL_EXTENSION = ".jpeg"
+
+
+# Runs in a worker process, it must not use anything from GTK
+def generate_thumbnail(hdri_file_path, thumbnails_path, width, height):
+    from wand.image import Image
+
+    digest = content_hash(hdri_file_path)
+    thumbnail_filepath = os.path.join(thumbnails_path, digest + THUMBNAIL_EXTENSION)
+
+    if not os.path.isfile(thumbnail_filepath):
+        temp_filepath = thumbnail_filepath + ".part"
+        with Image(filename=hdri_file_path) as img:
+            img.thumbnail(width, height)
+            img.gamma(1.7)
+            img.brightness_contrast(0, -5)
+            img.format = "jpeg"
+            img.save(filename=temp_filepath)
+        os.replace(temp_filepath, thumbnail_filepath)
+
+    return digest, thumbnail_filepath
+
+
+class ThumbnailCache(GObject.Object):
+    """Thumbnails of the HDRIs, generated in a process pool and stored on
+    disk keyed by the path, size, mtime and content of the HDRI."""
+
+    __gtype_name__ = "ThumbnailCache"
+
+    __gsignals__ = {
+        "thumbnail-ready": (GObject.SignalFlags.RUN_FIRST, None, (str, str)),
+        "thumbnail-failed": (GObject.SignalFlags.RUN_FIRST, None, (str,)),
+    }
+
+    _instances = {}
+
+    def __init__(self, thumbnails_path, width=300, height=200):
+        super().__init__()
+
+        self.logger = logger_lib.logger
+
+        self.thumbnails_path = thumbnails_path
+        self.width = width
+        self.height = height
+
+        os.makedirs(self.thumbnails_path, exist_ok=True)
+
+        self._index_path = os.path.join(self.thumbnails_path, INDEX_FILENAME)
+        self._index = self._read_index()
+
+        self._pending = {}
+        self._executor = None
+
+    @classmethod
+    def get_default(cls, thumbnails_path):
+        thumbnails_path = os.path.normpath(thumbnails_path)
+        if thumbnails_path not in cls._instances:
+            cls._instances[thumbnails_path] = cls(thumbnails_path)
+        return cls._instances[thumbnails_path]
+
+    def request(self, hdri_paths):
+        # Forget the HDRIs that have been removed
+        for path in list(self._index):
+            if not os.path.isfile(path):
+                del self._index[path]
+
+        for path in hdri_paths:
+            thumbnail = self.lookup(path)
+            if thumbnail:
+                self.emit("thumbnail-ready", path, thumbnail)
+            elif path not in self._pending:
+                self._submit(path)
+
+        if not self._pending:
+            self._write_index()
+            self.evict_orphans()
+
+    def lookup(self, hdri_path):
+        entry = self._index.get(hdri_path)
+        if entry is None:
+            return None
+
+        stamp = file_stamp(hdri_path)
+        if stamp is None or list(stamp) != entry["stamp"]:
+            return None
+
+        if not os.path.isfile(entry["thumbnail"]):
+            return None
+
+        return entry["thumbnail"]
+
+    def evict_orphans(self):
+        referenced = {entry["thumbnail"] for entry in self._index.values()}
+
+        for filename in os.listdir(self.thumbnails_path):
+            filepath = os.path.join(self.thumbnails_path, filename)
+            if filepath == self._index_path or filepath in referenced:
+                continue
+            try:
+                os.remove(filepath)
+                self.logger.debug(f"Evicted orphaned thumbnail {filename}")
+            except OSError as e:
+                self.logger.warning(f"Couldn't remove {filepath}: {e}")
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Forking a process with GTK running isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _submit(self, hdri_path):
+        stamp = file_stamp(hdri_path)
+        start_ns = tracing.now()
+        future = self._get_executor().submit(
+            generate_thumbnail,
+            hdri_path,
+            self.thumbnails_path,
+            self.width,
+            self.height,
+        )
+        self._pending[hdri_path] = future
+
+        future.add_done_callback(
+            lambda future: GLib.idle_add(
+                self._on_done, hdri_path, stamp, start_ns, future
+            )
+        )
+
+    def _on_done(self, hdri_path, stamp, start_ns, future):
+        del self._pending[hdri_path]
+        tracing.record("thumbnail", start_ns, filepath=hdri_path)
+
+        try:
+            digest, thumbnail = future.result()
+        except Exception as e:
+            self.logger.warning(f"Couldn't open HDRI file {hdri_path}, skipping: {e}")
+            self.emit("thumbnail-failed", hdri_path)
+        else:
+            self._index[hdri_path] = {
+                "stamp": list(stamp) if stamp else None,
+                "hash": digest,
+                "thumbnail": thumbnail,
+            }
+            self.emit("thumbnail-ready", hdri_path, thumbnail)
+
+        if not self._pending:
+            self._write_index()
+            self.evict_orphans()
+
+        return False
+
+    def _read_index(self):
+        try:
+            with open(self._index_path, "r") as file:
+                return json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self):
+        temp_path = self._index_path + ".part"
+        try:
+            with open(temp_path, "w") as file:
+                json.dump(self._index, file, indent=4)
+            os.replace(temp_path, self._index_path)
+        except OSError as e:
+            self.logger.warning(f"Couldn't write the thumbnail index: {e}")
@@ -0,0 +1,143 @@
+# tracing.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import json
+import time
+import atexit
+import threading
+
+from contextlib import contextmanager
+
+from . import logger_lib
+
+# Set to a file path to record a trace, it can also be set with --trace
+TRACE_ENVIRONMENT_VARIABLE = "EXHIBIT_TRACE"
+
+_trace_path = None
+_events = []
+_lock = threading.Lock()
+
+
+def enable(trace_path):
+    global _trace_path
+
+    if _trace_path is None:
+        atexit.register(dump)
+    _trace_path = os.path.abspath(trace_path)
+
+
+def enable_from_environment():
+    trace_path = os.environ.get(TRACE_ENVIRONMENT_VARIABLE)
+    if trace_path:
+        enable(trace_path)
+
+
+def is_enabled():
+    return _trace_path is not None
+
+
+def now():
+    return time.monotonic_ns()
+
+
+# Records an event that started at start_ns and ended at end_ns, both taken
+#   with now(), useful when the work happens somewhere else
+def record(name, start_ns, end_ns=None, category="exhibit", **args):
+    if _trace_path is None:
+        return
+
+    if end_ns is None:
+        end_ns = now()
+
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": start_ns / 1000,
+        "dur": (end_ns - start_ns) / 1000,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+def instant(name, category="exhibit", **args):
+    if _trace_path is None:
+        return
+
+    event = {
+        "name": name,
+        "cat": category,
+        "ph": "i",
+        "s": "p",
+        "ts": now() / 1000,
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+@contextmanager
+def span(name, category="exhibit", **args):
+    if _trace_path is None:
+        yield
+        return
+
+    start_ns = now()
+    try:
+        yield
+    finally:
+        record(name, start_ns, category=category, **args)
+
+
+# Writes the events in the Chrome trace event format, it can be opened with
+#   about:tracing or Perfetto
+def dump():
+    if _trace_path is None:
+        return
+
+    with _lock:
+        events = list(_events)
+
+    thread_names = [
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {"name": thread.name},
+        }
+        for thread in threading.enumerate()
+    ]
+
+    temp_path = _trace_path + ".part"
+    try:
+        with open(temp_path, "w") as file:
+            json.dump({"traceEvents": thread_names + events}, file)
+        os.replace(temp_path, _trace_path)
+    except OSError as e:
+        logger_lib.logger.warning(f"Couldn't write the trace: {e}")
+        return
+
+    logger_lib.logger.info(f"Wrote {len(events)} trace events to {_trace_path}")
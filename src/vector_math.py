@@ -47,3 +47,18 @@ def v_cross(vector1, vector2):
     z = vector1[0] * vector2[1] - vector1[1] * vector2[0]
 
     return (x, y, z)
+
+
+def v_lerp(vector1, vector2, t):
+    return tuple(v1 + (v2 - v1) * t for v1, v2 in zip(vector1, vector2))
+
+
+# Rodrigues' rotation formula, the axis must be normalized
+def v_rotate(vector, axis, angle):
+    cos = math.cos(angle)
+    sin = math.sin(angle)
+    dot = sum(v_dot_p(axis, vector))
+    return v_add(
+        v_add(v_mul(vector, cos), v_mul(v_cross(axis, vector), sin)),
+        v_mul(axis, dot * (1 - cos)),
+    )
@@ -20,9 +20,29 @@
 from gi.repository import Gtk, Gdk, GLib, Gio, GObject
 
 import f3d
+import time
+import threading
+
+from contextlib import contextmanager
 
 from ..vector_math import p_dist, v_abs, v_norm, v_add, v_sub, v_mul, v_dot_p
+from ..file_utils import file_stamp, content_hash
+from ..file_monitor import find_sidecar_files
+from ..f3d_options import OPTION_KEYS
+from ..engine_pool import (
+    EnginePool,
+    get_backend,
+    create_engine,
+    create_engine_from_thread,
+)
+from ..render_stats import RenderStats
+from ..animation_cache import AnimationCache, image_to_texture
+from ..point_budget import get_reduced_point_cloud
+from ..mesh_proxy import get_mesh_proxy
+from ..image_export import get_view_height
+from ..scene_cache import SceneCache
 from .. import logger_lib
+from .. import tracing
 
 up_dirs_vector = {
     "-X": (-1.0, 0.0, 0.0),
@@ -33,59 +53,44 @@ up_dirs_vector = {
     "+Z": (0.0, 0.0, 1.0),
 }
 
+# Options turned off while the camera is being moved, each level also turns
+#   off the options of the previous ones
+INTERACTION_QUALITY_LEVELS = [
+    {},
+    {
+        "render.effect.ambient_occlusion": False,
+        "render.effect.antialiasing.enable": False,
+        "render.background.blur.enable": False,
+    },
+    {
+        "render.effect.translucency_support": False,
+        "render.show_edges": False,
+        "render.hdri.ambient": False,
+    },
+]
+
+# Full quality is restored when no scroll or key press happened for this long
+INTERACTION_IDLE_TIMEOUT = 250
+
+# A cached animation frame is replaced by a real render when the time stops
+#   changing for this long
+ANIMATION_SETTLE_TIMEOUT = 300
+
+# Animation frames are cached only after the view didn't change for this long
+ANIMATION_CACHE_DELAY = 500
+
 
 @Gtk.Template(resource_path="/io/github/nokse22/Exhibit/ui/f3d_viewer.ui")
 class F3DViewer(Gtk.GLArea):
     __gtype_name__ = "F3DViewer"
 
-    keys = {
-        "grid": "render.grid.enable",
-        "grid-absolute": "render.grid.absolute",
-        "translucency-support": "render.effect.translucency_support",
-        "tone-mapping": "render.effect.tone_mapping",
-        "ambient-occlusion": "render.effect.ambient_occlusion",
-        "anti-aliasing": "render.effect.antialiasing.enable",
-        "hdri-ambient": "render.hdri.ambient",
-        "hdri-skybox": "render.background.skybox",
-        "light-intensity": "render.light.intensity",
-        "orthographic": "scene.camera.orthographic",
-        "blur-background": "render.background.blur.enable",
-        "blur-coc": "render.background.blur.coc",
-        "bg-color": "render.background.color",
-        "show-edges": "render.show_edges",
-        "edges-width": "render.line_width",
-        "up": "scene.up_direction",
-        "sprite-enabled": "model.point_sprites.enable",
-        "sprites-size": "model.point_sprites.size",
-        "sprites-type": "model.point_sprites.type",
-        "point-size": "render.point_size",
-        "model-color": "model.color.rgb",
-        "model-metallic": "model.material.metallic",
-        "model-roughness": "model.material.roughness",
-        "model-opacity": "model.color.opacity",
-        "scivis-component": "model.scivis.component",
-        "hdri-file": "render.hdri.file",
-        "cells": "model.scivis.cells",
-        "scivis-enabled": "model.scivis.enable",
-        "armature-enable": "render.armature.enable",
-        # The following settings don't have an UI
-        "texture-matcap": "model.matcap.texture",
-        "texture-base-color": "model.color.texture",
-        "emissive-factor": "model.emissive.factor",
-        "texture-emissive": "model.emissive.texture",  # rename to material-emissive
-        "texture-material": "model.material.texture",  # rename to material-texture
-        "normal-scale": "model.normal.scale",
-        "texture-normal": "model.normal.texture",  # rename to normal-texture
-        "volume": "model.volume.enable",  # rename to volume-enabled
-        "inverse": "model.volume.inverse",  # rename to volume-inverse
-        "final-shader": "render.effect.final_shader",
-        "grid-unit": "render.grid.unit",
-        "grid-subdivisions": "render.grid.subdivisions",
-        "grid-color": "render.grid.color",
-        "scalar": "model.scivis.array_name",  # rename to scivis-name
-        "animation-index": "scene.animation.index",
+    __gsignals__ = {
+        "first-frame": (GObject.SignalFlags.RUN_FIRST, None, (float,)),
+        "cached-frame": (GObject.SignalFlags.RUN_FIRST, None, (object,)),
     }
 
+    keys = OPTION_KEYS
+
     def __init__(self, *args):
         self.logger = logger_lib.logger
 
@@ -94,6 +99,10 @@ class F3DViewer(Gtk.GLArea):
         self.window = None
         self.camera = None
 
+        # Size of the GL area in pixels, set when it's resized
+        self.width = 0
+        self.height = 0
+
         f3d.Log.set_use_coloring(True)
         f3d.Log.set_verbose_level(f3d.Log.DEBUG)
         f3d.Log.print(f3d.Log.DEBUG, "debug")
@@ -120,8 +129,10 @@ class F3DViewer(Gtk.GLArea):
         self.create_action("tilt-up", self.tilt_action, "up")
         self.create_action("tilt-down", self.tilt_action, "down")
 
-        self.set_auto_render(True)
+        # Frames are rendered only when requested, see request_render
+        self.set_auto_render(False)
         # self.connect("realize", self.on_realize)
+        self.connect("unrealize", self.on_unrealize)
         self.connect("render", self.on_render)
         self.connect("resize", self.on_resize)
 
@@ -149,36 +160,197 @@ class F3DViewer(Gtk.GLArea):
         self._animation_time = 0
         self._playing = False
 
+        # The animation is advanced by the frame clock by the real time that
+        #   passed, the time is loaded into the scene only right before a
+        #   render so frames are dropped when rendering can't keep up
+        self._playback_speed = 1.0
+        self._loop = False
+        self._animation_tick_id = None
+        self._animation_frame_time = None
+        self._animation_time_changed = False
+        self._dropped_frames = 0
+        self._played_frames = 0
+
+        # Rendered animation frames for the current view, shown instead of
+        #   rendering while scrubbing or playing
+        self.animation_cache = AnimationCache()
+        self._animation_cache_enabled = False
+        self._animation_cache_source = None
+        self._animation_settle_source = None
+        self._showing_cached_frame = False
+
+        # Files in the scene with their stamps and content hash, used to
+        #   reload only when something actually changed
+        self.loaded_files = []
+        self._parts = {}
+
+        # Text models are replaced by a binary copy once it's converted and
+        #   large point clouds by a reduced copy, these are the files
+        #   actually added to the scene
+        self.scene_paths = {}
+        self.reduced_files = set()
+        self._scene_cache = True
+        self._reduce_point_clouds = True
+        self._point_budget = 20_000_000
+
+        # A simplified copy of big models in another engine, rendered in its
+        #   place while the camera is moving
+        self._mesh_proxy = None
+        self._mesh_proxy_enabled = False
+        self._mesh_proxy_threshold = 2_000_000
+        self._mesh_proxy_generation = 0
+        self._showing_mesh_proxy = False
+
+        # Held while the scene is being changed, loading happens on a thread
+        self.scene_lock = threading.RLock()
+
+        # Engine lifecycle, the engine is bound to the GL context it first
+        #   rendered with and is rebuilt only if the backend or context change
+        self._engine_backend = None
+        self._engine_context = None
+        self._context_lost = False
+
+        # Options collected by batch_options, pushed to the engine at the end
+        self._options_batch_depth = 0
+        self._pending_options = {}
+
+        # Render scheduling, every request in a frame is coalesced into a
+        #   single render that is skipped if nothing visible changed
+        self._revision = 0
+        self._rendered_signature = None
+        self._tick_id = None
+        self.renders_requested = 0
+        self.renders_done = 0
+        self.renders_skipped = 0
+
+        self.render_stats = RenderStats()
+
+        # Adaptive quality, the level needed to stay under the target frame
+        #   time is learned while interacting and reused for the next gesture
+        self._adaptive_quality = True
+        self._target_frame_time = 33.0
+        self._interacting = False
+        self._quality_level = 0
+        self._interaction_level = 0
+        self._frame_time = None
+        self._interaction_timeout = None
+
+        # Time to first frame measurement
+        self._load_start_time = None
+        self._load_engine_created = False
+        self._load_done = False
+
         self.set_allowed_apis(Gdk.GLAPI.GL)
 
         self.initialize()
 
+    def get_backend(self):
+        return get_backend()
+
     def initialize(self):
-        backends_list = f3d.Engine.get_rendering_backend_list()
-        self.logger.info(f"Available F3D backends: {backends_list}")
-
-        if GLib.getenv("WAYLAND_DISPLAY"):
-            self.logger.info("Initializing F3D with EGL")
-            self.engine = f3d.Engine.create_external_egl()
-        elif GLib.getenv("DISPLAY"):
-            self.logger.info("Initializing F3D with GLX")
-            self.engine = f3d.Engine.create_external_glx()
-        else:
-            self.logger.info("Initializing F3D with automatic")
-            self.engine = f3d.Engine.create(True)
+        start_time = time.monotonic()
+
+        backend = self.get_backend()
+        self.logger.info(f"Initializing F3D with {backend}")
+
+        # Opening many files at once warms up engines on a thread
+        with tracing.span("engine-creation", backend=backend):
+            self.engine = EnginePool.get_default().take(backend)
+            if self.engine:
+                self.logger.debug("Using a pooled F3D engine")
+                self.engine.options.update(self.settings)
+            else:
+                self.engine = self.create_engine(self.settings)
 
         if not self.engine:
             self.logger.critical("Failed to initialize F3D with any available backend")
+            backends_list = f3d.Engine.get_rendering_backend_list()
+            self.logger.info(f"Available F3D backends: {backends_list}")
             return
 
         self.scene = self.engine.scene
         self.window = self.engine.window
         self.camera = self.window.camera
 
-        self.engine.autoload_plugins()
-        self.engine.options.update(self.settings)
+        self._engine_backend = backend
+        self._engine_context = None
+        self._context_lost = False
+
+        elapsed = (time.monotonic() - start_time) * 1000
+        self.logger.info(f"F3D viewer initialized successfully in {elapsed:.1f} ms")
+
+    # Can be called from any thread, the engine won't touch GL until rendered
+    def create_engine(self, options):
+        return create_engine(self.get_backend(), options)
+
+    def use_engine(self, engine, filepath):
+        with self.scene_lock:
+            self.engine = engine
+            self.scene = self.engine.scene
+            self.window = self.engine.window
+            self.camera = self.window.camera
+
+            self.engine.options.update(self.settings)
+            if self.settings["render.hdri.ambient"]:
+                f3d_options = {"render.hdri.ambient": False}
+                self.engine.options.update(f3d_options)
+
+            self._engine_backend = self.get_backend()
+            self._engine_context = None
+            self._context_lost = False
+
+            self.loaded_files = []
+            self._parts = {}
+            self.scene_paths = {}
+            self.reduced_files = set()
+            self._track_part(filepath)
+            self._load_done = True
+            self._revision += 1
+            self._update_mesh_proxy()
+
+        self.notify("lower-time-range")
+        self.notify("upper-time-range")
+
+    def ensure_engine(self):
+        if (
+            self.engine
+            and not self._context_lost
+            and self._engine_backend == self.get_backend()
+        ):
+            self.logger.debug("Reusing the F3D engine")
+            return False
+
+        self.initialize()
+        return True
+
+    def start_load_measurement(self, engine_created):
+        self._load_start_time = time.monotonic()
+        self._load_engine_created = engine_created
+        self._load_done = False
+
+    def on_unrealize(self, *args):
+        self.logger.debug(f"Render counters: {self.get_render_counters()}")
+
+        # The GL resources of the engine died with the context
+        if self._engine_context is not None:
+            self._context_lost = True
 
-        self.logger.info("F3D viewer initialized successfully")
+    def on_context_changed(self):
+        self.logger.info("GL context changed, rebuilding the F3D engine")
+
+        camera_state = self.get_camera_state()
+
+        self.initialize()
+
+        if self.loaded_files:
+            try:
+                self.scene.add(self.get_scene_paths(self.loaded_files))
+            except Exception as e:
+                self.logger.error(f"Error while reloading files: {e}")
+            self.set_camera_state(camera_state)
+
+        self._revision += 1
+        self._update_mesh_proxy()
 
     @GObject.Property(type=float)
     def upper_time_range(self):
@@ -197,8 +369,12 @@ class F3DViewer(Gtk.GLArea):
     @animation_time.setter
     def animation_time(self, value):
         self._animation_time = value
-        self.scene.load_animation_time(self._animation_time)
-        self.queue_render()
+        self._animation_time_changed = True
+
+        if self._show_cached_frame():
+            self._schedule_animation_settle()
+        else:
+            self.request_render()
 
     @GObject.Property(type=bool, default=False)
     def playing(self):
@@ -206,18 +382,287 @@ class F3DViewer(Gtk.GLArea):
 
     @playing.setter
     def playing(self, value):
+        if value == self._playing:
+            return
         self._playing = value
 
         if self._playing:
             if self.animation_time >= self.upper_time_range:
                 self.animation_time = self.lower_time_range
-            GLib.timeout_add(10, self._advance_animation)
+            self._animation_frame_time = None
+            self._dropped_frames = 0
+            self._played_frames = 0
+            self._animation_tick_id = self.add_tick_callback(self._on_animation_tick)
+        else:
+            if self._animation_tick_id is not None:
+                self.remove_tick_callback(self._animation_tick_id)
+                self._animation_tick_id = None
+            self._schedule_animation_settle()
+            self.logger.debug(
+                f"Played {self._played_frames} animation frames, "
+                f"dropped {self._dropped_frames}"
+            )
 
-    def _advance_animation(self):
-        self.animation_time = self.animation_time + 0.01
-        if self.animation_time >= self.upper_time_range:
-            self.playing = False
-        return self._playing
+    @GObject.Property(type=float, default=1.0)
+    def playback_speed(self):
+        return self._playback_speed
+
+    @playback_speed.setter
+    def playback_speed(self, value):
+        self._playback_speed = value
+
+    @GObject.Property(type=bool, default=False)
+    def loop(self):
+        return self._loop
+
+    @loop.setter
+    def loop(self, value):
+        self._loop = value
+
+    @GObject.Property(type=bool, default=True)
+    def scene_cache(self):
+        return self._scene_cache
+
+    @scene_cache.setter
+    def scene_cache(self, value):
+        self._scene_cache = value
+
+    @GObject.Property(type=bool, default=True)
+    def reduce_point_clouds(self):
+        return self._reduce_point_clouds
+
+    @reduce_point_clouds.setter
+    def reduce_point_clouds(self, value):
+        self._reduce_point_clouds = value
+
+    @GObject.Property(type=int, default=20_000_000)
+    def point_budget(self):
+        return self._point_budget
+
+    @point_budget.setter
+    def point_budget(self, value):
+        self._point_budget = value
+
+    # The file added to the scene in place of filepath, its binary copy if
+    #   it was converted before and reduced if it's a point cloud over the
+    #   budget
+    def get_scene_path(self, filepath):
+        scene_path = filepath
+        if self._scene_cache:
+            scene_cache = SceneCache.get_default()
+            scene_path = scene_cache.lookup(filepath)
+            if scene_path is None:
+                scene_cache.request(filepath)
+                scene_path = filepath
+
+        reduced_path = None
+        if self._reduce_point_clouds:
+            reduced_path = get_reduced_point_cloud(scene_path, self._point_budget)
+        if reduced_path:
+            self.reduced_files.add(filepath)
+        else:
+            self.reduced_files.discard(filepath)
+
+        self.scene_paths[filepath] = reduced_path or scene_path
+        return self.scene_paths[filepath]
+
+    def get_scene_paths(self, filepaths):
+        return [self.get_scene_path(filepath) for filepath in filepaths]
+
+    def get_reduced_files(self):
+        return [
+            filepath
+            for filepath in self.loaded_files
+            if filepath in self.reduced_files
+        ]
+
+    @GObject.Property(type=int)
+    def dropped_frames(self):
+        return self._dropped_frames
+
+    @GObject.Property(type=bool, default=False)
+    def animation_cache_enabled(self):
+        return self._animation_cache_enabled
+
+    @animation_cache_enabled.setter
+    def animation_cache_enabled(self, value):
+        self._animation_cache_enabled = value
+        if not value:
+            self.animation_cache.clear()
+        self._schedule_animation_cache()
+
+    @GObject.Property(type=float, default=30.0)
+    def animation_cache_rate(self):
+        return self.animation_cache.sample_rate
+
+    @animation_cache_rate.setter
+    def animation_cache_rate(self, value):
+        self.animation_cache.sample_rate = value
+        self.animation_cache.clear()
+        self._schedule_animation_cache()
+
+    # In MiB
+    @GObject.Property(type=int, default=512)
+    def animation_cache_memory_budget(self):
+        return self.animation_cache.memory_budget // (1024 * 1024)
+
+    @animation_cache_memory_budget.setter
+    def animation_cache_memory_budget(self, value):
+        self.animation_cache.memory_budget = value * 1024 * 1024
+        self.animation_cache.clear()
+        self._schedule_animation_cache()
+
+    def _show_cached_frame(self):
+        if not self._animation_cache_enabled or not self.scene_lock.acquire(
+            blocking=False
+        ):
+            return False
+
+        try:
+            if self.animation_cache.signature != self._get_view_signature():
+                return False
+            texture = self.animation_cache.lookup(self._animation_time)
+        finally:
+            self.scene_lock.release()
+
+        if texture is None:
+            return False
+
+        self._showing_cached_frame = True
+        self.emit("cached-frame", texture)
+        return True
+
+    def _hide_cached_frame(self):
+        if self._showing_cached_frame:
+            self._showing_cached_frame = False
+            self.emit("cached-frame", None)
+
+    # Renders the real frame once the time stops changing
+    def _schedule_animation_settle(self):
+        if self._animation_settle_source:
+            GLib.source_remove(self._animation_settle_source)
+            self._animation_settle_source = None
+
+        if self._showing_cached_frame and not self._playing:
+            self._animation_settle_source = GLib.timeout_add(
+                ANIMATION_SETTLE_TIMEOUT, self._on_animation_settle
+            )
+
+    def _on_animation_settle(self):
+        self._animation_settle_source = None
+        self.request_render()
+        return GLib.SOURCE_REMOVE
+
+    def _schedule_animation_cache(self):
+        if self._animation_cache_source:
+            GLib.source_remove(self._animation_cache_source)
+            self._animation_cache_source = None
+
+        if self._animation_cache_enabled:
+            self._animation_cache_source = GLib.timeout_add(
+                ANIMATION_CACHE_DELAY, self._start_animation_cache
+            )
+
+    def _start_animation_cache(self):
+        self._animation_cache_source = GLib.idle_add(
+            self._fill_animation_cache, priority=GLib.PRIORITY_LOW
+        )
+        return GLib.SOURCE_REMOVE
+
+    # Renders one missing frame at a time, so the UI stays responsive
+    def _fill_animation_cache(self):
+        if not self._animation_cache_enabled or self._playing or self._interacting:
+            self._animation_cache_source = None
+            return GLib.SOURCE_REMOVE
+
+        if not self.scene_lock.acquire(blocking=False):
+            return GLib.SOURCE_CONTINUE
+
+        try:
+            sample = None
+            lower, upper = self.scene.animation_time_range()
+            if upper > lower:
+                self.animation_cache.validate(
+                    self._get_view_signature(), lower, upper
+                )
+                sample = self.animation_cache.next_missing_sample(self._animation_time)
+
+            if sample is None:
+                self._animation_cache_source = None
+                self.logger.debug(
+                    f"{len(self.animation_cache)} animation frames cached"
+                )
+                return GLib.SOURCE_REMOVE
+
+            self.get_context().make_current()
+            with tracing.span("cache-animation-frame", sample=sample):
+                self.scene.load_animation_time(
+                    self.animation_cache.get_sample_time(sample)
+                )
+                image = self.window.render_to_image()
+            self.animation_cache.add(sample, image_to_texture(image))
+
+            # The scene is at another time now, the next render restores it
+            self._animation_time_changed = True
+            self._rendered_signature = None
+        finally:
+            self.scene_lock.release()
+
+        return GLib.SOURCE_CONTINUE
+
+    def _on_animation_tick(self, widget, frame_clock):
+        frame_time = frame_clock.get_frame_time()
+        if self._animation_frame_time is None:
+            self._animation_frame_time = frame_time
+            return GLib.SOURCE_CONTINUE
+
+        elapsed = frame_time - self._animation_frame_time
+        self._animation_frame_time = frame_time
+
+        # Frames the display showed while this one was late
+        refresh_interval = frame_clock.get_refresh_info(frame_time)[0]
+        if refresh_interval > 0:
+            dropped = max(0, round(elapsed / refresh_interval) - 1)
+            if dropped:
+                self._dropped_frames += dropped
+                self.notify("dropped-frames")
+        self._played_frames += 1
+
+        lower, upper = self.lower_time_range, self.upper_time_range
+        animation_time = (
+            self.animation_time + elapsed / 1_000_000 * self.playback_speed
+        )
+
+        if animation_time >= upper:
+            if self.loop and upper > lower:
+                animation_time = lower + (animation_time - lower) % (upper - lower)
+            else:
+                self.animation_time = upper
+                self._animation_tick_id = None
+                self.playing = False
+                return GLib.SOURCE_REMOVE
+
+        self.animation_time = animation_time
+        return GLib.SOURCE_CONTINUE
+
+    @GObject.Property(type=bool, default=True)
+    def adaptive_quality(self):
+        return self._adaptive_quality
+
+    @adaptive_quality.setter
+    def adaptive_quality(self, value):
+        self._adaptive_quality = value
+        if not self._adaptive_quality:
+            self._interaction_level = 0
+            self._set_quality_level(0)
+
+    @GObject.Property(type=float, default=33.0)
+    def target_frame_time(self):
+        return self._target_frame_time
+
+    @target_frame_time.setter
+    def target_frame_time(self, value):
+        self._target_frame_time = value
 
     @GObject.Property(type=bool, default=False)
     def orthographic(self):
@@ -235,7 +680,7 @@ class F3DViewer(Gtk.GLArea):
     def reset_to_bounds(self):
         self.camera.reset_to_bounds()
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     def front_view(self, *args):
         up_v = up_dirs_vector[self.settings["scene.up_direction"]]
@@ -244,7 +689,7 @@ class F3DViewer(Gtk.GLArea):
         self.camera.view_up = up_dirs_vector[self.settings["scene.up_direction"]]
         self.camera.reset_to_bounds()
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     def right_view(self, *args):
         up_v = up_dirs_vector[self.settings["scene.up_direction"]]
@@ -253,7 +698,7 @@ class F3DViewer(Gtk.GLArea):
         self.camera.view_up = up_dirs_vector[self.settings["scene.up_direction"]]
         self.camera.reset_to_bounds()
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     def top_view(self, *args):
         up_v = up_dirs_vector[self.settings["scene.up_direction"]]
@@ -263,7 +708,7 @@ class F3DViewer(Gtk.GLArea):
         self.camera.view_up = vector
         self.camera.reset_to_bounds()
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     def isometric_view(self, *args):
         up_v = up_dirs_vector[self.settings["scene.up_direction"]]
@@ -274,20 +719,54 @@ class F3DViewer(Gtk.GLArea):
         self.camera.view_up = up_dirs_vector[self.settings["scene.up_direction"]]
         self.camera.reset_to_bounds()
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     def update_options(self, options):
         f3d_options = {}
         for key, value in options.items():
             if key in self.keys:
                 f3d_key = self.keys[key]
+                # In a batch only the options that differ are pushed
+                if (
+                    self._options_batch_depth
+                    and self.settings.get(f3d_key) == value
+                    and f3d_key not in self._pending_options
+                ):
+                    continue
                 self.settings[f3d_key] = value
                 f3d_options[f3d_key] = value
 
-        print(f3d_options)
+        if self._options_batch_depth:
+            self._pending_options.update(f3d_options)
+            return
+
+        self._push_options(f3d_options)
+
+    # Merges all the update_options calls into a single engine update and
+    #   a single render
+    @contextmanager
+    def batch_options(self):
+        self._options_batch_depth += 1
+        try:
+            yield
+        finally:
+            self._options_batch_depth -= 1
+            if self._options_batch_depth == 0 and self._pending_options:
+                f3d_options = self._pending_options
+                self._pending_options = {}
+                self._push_options(f3d_options)
+
+    def _push_options(self, f3d_options):
+        self.logger.debug(f"Updating options: {f3d_options}")
+        if self._mesh_proxy:
+            self._mesh_proxy.options.update(f3d_options)
         if self.engine:
+            start_time = time.perf_counter()
             self.engine.options.update(f3d_options)
-            self.queue_render()
+            self.render_stats.add_option_update(
+                (time.perf_counter() - start_time) * 1000
+            )
+            self.request_render(invalidate=True)
 
     def render_image(self):
         self.get_context().make_current()
@@ -299,34 +778,64 @@ class F3DViewer(Gtk.GLArea):
         return self.scene.supports(filepath)
 
     def load_file(self, filepath):
+        with self.scene_lock:
+            return self._load_file(filepath)
+
+    def add_file(self, filepath):
+        with self.scene_lock:
+            return self._add_file(filepath)
+
+    # Reload the scene keeping the engine, the options and the HDRI, returns
+    #   the changed and unchanged files or None if the reload failed
+    def reload_files(self):
+        with self.scene_lock:
+            return self._reload_files()
+
+    def _load_file(self, filepath):
         if self.settings["render.hdri.ambient"]:
             f3d_options = {"render.hdri.ambient": False}
             self.engine.options.update(f3d_options)
 
         self.scene.clear()
+        self.loaded_files = []
+        self._parts = {}
+        self.scene_paths = {}
+        self.reduced_files = set()
 
         try:
-            self.scene.add(filepath)
+            with tracing.span("scene-add", filepath=filepath):
+                self.scene.add(self.get_scene_path(filepath))
         except Exception as e:
             self.logger.error(f"Error while loading file: {e}")
             return False
 
+        self._track_part(filepath)
+        self._load_done = True
+        self._revision += 1
+        self._update_mesh_proxy()
+
         self.notify("lower-time-range")
         self.notify("upper-time-range")
 
         return True
 
-    def add_file(self, filepath):
+    def _add_file(self, filepath):
         if self.settings["render.hdri.ambient"]:
             f3d_options = {"render.hdri.ambient": False}
             self.engine.options.update(f3d_options)
 
         try:
-            self.scene.add(filepath)
+            with tracing.span("scene-add", filepath=filepath):
+                self.scene.add(self.get_scene_path(filepath))
         except Exception as e:
             self.logger.error(f"Error while loading file: {e}")
             return False
 
+        self._track_part(filepath)
+        self._load_done = True
+        self._revision += 1
+        self._update_mesh_proxy()
+
         self.notify("lower-time-range")
         self.notify("upper-time-range")
 
@@ -334,11 +843,78 @@ class F3DViewer(Gtk.GLArea):
 
         return True
 
+    def _reload_files(self):
+        changed = []
+        unchanged = []
+        for filepath in self.loaded_files:
+            if self._part_changed(filepath):
+                changed.append(filepath)
+            else:
+                unchanged.append(filepath)
+
+        if not changed:
+            self.logger.info(f"Nothing changed, reusing {unchanged}")
+            self._load_done = True
+            return changed, unchanged
+
+        self.logger.info(f"Reloading {changed}, unchanged: {unchanged}")
+
+        if self.settings["render.hdri.ambient"]:
+            f3d_options = {"render.hdri.ambient": False}
+            self.engine.options.update(f3d_options)
+
+        # libf3d can't remove single parts from a scene, so the unchanged
+        #   ones are added again in the same call
+        self.scene.clear()
+
+        try:
+            with tracing.span("scene-add", filepath=self.loaded_files):
+                self.scene.add(self.get_scene_paths(self.loaded_files))
+        except Exception as e:
+            self.logger.error(f"Error while reloading files: {e}")
+            return None
+
+        self._load_done = True
+        self._revision += 1
+        self._update_mesh_proxy()
+
+        self.notify("lower-time-range")
+        self.notify("upper-time-range")
+
+        return changed, unchanged
+
+    def _part_files(self, filepath):
+        return [filepath] + find_sidecar_files(filepath)
+
+    def _track_part(self, filepath):
+        if filepath not in self.loaded_files:
+            self.loaded_files.append(filepath)
+
+        # The hash is computed lazily, only when the stamps change
+        stamps = {path: file_stamp(path) for path in self._part_files(filepath)}
+        self._parts[filepath] = {"stamps": stamps, "hash": None}
+
+    def _part_changed(self, filepath):
+        part = self._parts[filepath]
+        files = self._part_files(filepath)
+        stamps = {path: file_stamp(path) for path in files}
+
+        if stamps == part["stamps"]:
+            return False
+
+        digest = content_hash(*files)
+        changed = part["hash"] is None or digest != part["hash"]
+
+        part["stamps"] = stamps
+        part["hash"] = digest
+
+        return changed
+
     def done(self):
         if self.settings["render.hdri.ambient"]:
             f3d_options = {"render.hdri.ambient": True}
             self.engine.options.update(f3d_options)
-            self.queue_render()
+            self.request_render(invalidate=True)
 
         # f3d_options = {"model.scivis.cells": False, "model.scivis.enable": True}
         # self.engine.options.update(f3d_options)
@@ -356,14 +932,294 @@ class F3DViewer(Gtk.GLArea):
         def _set_hdri_ambient_true():
             f3d_options = {"render.hdri.ambient": True}
             self.engine.options.update(f3d_options)
-            self.queue_render()
+            self.request_render(invalidate=True)
 
         if self.settings["render.hdri.ambient"]:
             GLib.timeout_add(100, _set_hdri_ambient_true)
 
+    def begin_interaction(self):
+        if self._interaction_timeout:
+            GLib.source_remove(self._interaction_timeout)
+            self._interaction_timeout = None
+
+        if self._interacting:
+            return
+        self._interacting = True
+        self._frame_time = None
+
+        if self.adaptive_quality:
+            self._set_quality_level(self._interaction_level)
+
+    # Restores the full quality now, or after a delay if there isn't a clear
+    #   end of the interaction like with scrolling
+    def end_interaction(self, delay=0):
+        if self._interaction_timeout:
+            GLib.source_remove(self._interaction_timeout)
+            self._interaction_timeout = None
+
+        if delay:
+            self._interaction_timeout = GLib.timeout_add(
+                delay, self._on_interaction_timeout
+            )
+        else:
+            self._on_interaction_timeout()
+
+    def _on_interaction_timeout(self):
+        self._interaction_timeout = None
+        self._interacting = False
+        self._frame_time = None
+        self._set_quality_level(0)
+        if self._showing_mesh_proxy:
+            self.request_render(invalidate=True)
+        return GLib.SOURCE_REMOVE
+
+    @GObject.Property(type=bool, default=False)
+    def mesh_proxy(self):
+        return self._mesh_proxy_enabled
+
+    @mesh_proxy.setter
+    def mesh_proxy(self, value):
+        self._mesh_proxy_enabled = value
+        self._update_mesh_proxy()
+
+    @GObject.Property(type=int, default=2_000_000)
+    def mesh_proxy_threshold(self):
+        return self._mesh_proxy_threshold
+
+    @mesh_proxy_threshold.setter
+    def mesh_proxy_threshold(self, value):
+        self._mesh_proxy_threshold = value
+        self._update_mesh_proxy()
+
+    # The zoom of orthographic cameras isn't part of the camera state, so
+    #   the proxy can't follow it
+    def _use_mesh_proxy(self):
+        return (
+            self._interacting
+            and self._mesh_proxy is not None
+            and not self.settings.get("scene.camera.orthographic")
+        )
+
+    # Drops the proxy of the previous scene and builds the new one on a
+    #   thread, can be called from any thread
+    def _update_mesh_proxy(self):
+        self._mesh_proxy_generation += 1
+        self._mesh_proxy = None
+
+        if not self._mesh_proxy_enabled or not self.loaded_files:
+            return
+
+        files = [
+            (filepath, self.scene_paths.get(filepath, filepath))
+            for filepath in self.loaded_files
+        ]
+        threading.Thread(
+            target=self._build_mesh_proxy,
+            args=(self._mesh_proxy_generation, files, dict(self.settings)),
+            daemon=True,
+        ).start()
+
+    def _build_mesh_proxy(self, generation, files, options):
+        paths = []
+        simplified = False
+        for filepath, scene_path in files:
+            if generation != self._mesh_proxy_generation:
+                return
+            proxy_path = get_mesh_proxy(filepath, self._mesh_proxy_threshold)
+            simplified = simplified or proxy_path is not None
+            paths.append(proxy_path or scene_path)
+
+        if not simplified or generation != self._mesh_proxy_generation:
+            return
+
+        try:
+            engine = create_engine_from_thread(self.create_engine, options)
+            engine.scene.add(paths)
+        except Exception as e:
+            self.logger.warning(f"Couldn't load the simplified models: {e}")
+            return
+
+        GLib.idle_add(self._on_mesh_proxy_ready, generation, engine)
+
+    def _on_mesh_proxy_ready(self, generation, engine):
+        with self.scene_lock:
+            if generation == self._mesh_proxy_generation:
+                engine.options.update(self._get_quality_options(self._quality_level))
+                self._mesh_proxy = engine
+                self.logger.debug("Simplified models ready")
+        return GLib.SOURCE_REMOVE
+
+    def _set_quality_level(self, level):
+        if level == self._quality_level:
+            return
+        self._quality_level = level
+
+        f3d_options = self._get_quality_options(level)
+
+        self.logger.debug(f"Interaction quality level {level}")
+
+        # The proxy is rendered during gestures, it needs the lower quality
+        #   the most
+        if self._mesh_proxy:
+            self._mesh_proxy.options.update(f3d_options)
+
+        if self.engine:
+            self.engine.options.update(f3d_options)
+            self.request_render(invalidate=True)
+
+    # Options not set yet are left alone, there is nothing to restore
+    def _get_quality_options(self, level):
+        f3d_options = {}
+        for index, level_options in enumerate(INTERACTION_QUALITY_LEVELS):
+            for key, value in level_options.items():
+                if key in self.settings:
+                    f3d_options[key] = value if index <= level else self.settings[key]
+        return f3d_options
+
+    # Frame times are measured on the CPU, the driver may still be drawing,
+    #   but they are enough to tell a heavy scene from a light one
+    def _update_frame_time(self, frame_time):
+        if not self.adaptive_quality:
+            return
+
+        if not self._interacting:
+            # Full quality is fast enough, don't reduce it in the next gesture
+            if self._quality_level == 0 and frame_time <= self.target_frame_time:
+                self._interaction_level = 0
+            return
+
+        if self._frame_time is None:
+            self._frame_time = frame_time
+        else:
+            self._frame_time = 0.7 * self._frame_time + 0.3 * frame_time
+
+        if (
+            self._frame_time > self.target_frame_time
+            and self._quality_level < len(INTERACTION_QUALITY_LEVELS) - 1
+        ):
+            self._interaction_level = self._quality_level + 1
+            self._frame_time = None
+            GLib.idle_add(self._raise_quality_level)
+
+    def _raise_quality_level(self):
+        if self._interacting:
+            self._set_quality_level(self._interaction_level)
+        return GLib.SOURCE_REMOVE
+
+    # Can be called any number of times per frame, the view is rendered at
+    #   most once on the next frame clock tick. Camera changes are detected,
+    #   anything else that changes the image must invalidate
+    def request_render(self, invalidate=False):
+        self.renders_requested += 1
+        if invalidate:
+            self._revision += 1
+
+        if self._tick_id is None:
+            self._tick_id = self.add_tick_callback(self._on_frame_tick)
+
+    def get_render_counters(self):
+        return {
+            "requested": self.renders_requested,
+            "rendered": self.renders_done,
+            "skipped": self.renders_skipped,
+        }
+
+    def _on_frame_tick(self, widget, frame_clock):
+        self._tick_id = None
+
+        signature = None
+        if self.scene_lock.acquire(blocking=False):
+            try:
+                signature = self._get_render_signature()
+            finally:
+                self.scene_lock.release()
+
+        if signature is not None and signature == self._rendered_signature:
+            self.renders_skipped += 1
+        else:
+            self.queue_render()
+
+        return GLib.SOURCE_REMOVE
+
+    def _get_render_signature(self):
+        signature = self._get_view_signature()
+        if signature is None:
+            return None
+        return signature + (self._animation_time,)
+
+    # Everything that changes the image except the animation time
+    def _get_view_signature(self):
+        if not self.camera:
+            return None
+
+        state = self.camera.state
+        return (
+            self._revision,
+            self.engine,
+            self.get_width(),
+            self.get_height(),
+            tuple(state.position),
+            tuple(state.focal_point),
+            tuple(state.view_up),
+            state.view_angle,
+            # The zoom of orthographic cameras isn't part of their state
+            self.get_view_height(),
+        )
+
     def on_render(self, area, ctx):
-        self.window.size = self.width, self.height
-        self.window.render()
+        # Don't wait for a load to finish, the view will render again after it
+        if not self.scene_lock.acquire(blocking=False):
+            return
+
+        try:
+            self._render(ctx)
+        finally:
+            self.scene_lock.release()
+
+    def _render(self, ctx):
+        if self._context_lost or (
+            self._engine_context is not None and self._engine_context != ctx
+        ):
+            self.on_context_changed()
+        self._engine_context = ctx
+
+        # The proxy follows the camera of the full model
+        window = self.window
+        self._showing_mesh_proxy = self._use_mesh_proxy()
+        if self._showing_mesh_proxy:
+            window = self._mesh_proxy.window
+            window.camera.state = self.camera.state
+
+        window.size = self.width, self.height
+
+        if self._animation_time_changed:
+            self._animation_time_changed = False
+            with tracing.span("load-animation-time"):
+                self.scene.load_animation_time(self._animation_time)
+
+        start_time = time.perf_counter()
+        with tracing.span("render", proxy=self._showing_mesh_proxy):
+            window.render()
+        frame_time = (time.perf_counter() - start_time) * 1000
+
+        self.render_stats.add_frame(frame_time)
+        self._update_frame_time(frame_time)
+
+        self.renders_done += 1
+
+        signature = self._get_render_signature()
+        if signature != self._rendered_signature:
+            self._schedule_animation_cache()
+        self._rendered_signature = signature
+        self._hide_cached_frame()
+
+        if self._load_start_time is not None and self._load_done:
+            elapsed = (time.monotonic() - self._load_start_time) * 1000
+            engine = "new engine" if self._load_engine_created else "reused engine"
+            self.logger.info(f"Time to first frame: {elapsed:.1f} ms ({engine})")
+            self._load_start_time = None
+            tracing.instant("first-frame", elapsed=elapsed)
+            self.emit("first-frame", elapsed)
 
     def get_camera_to_focal_distance(self):
         up = up_dirs_vector[self.settings["scene.up_direction"]]
@@ -392,9 +1248,12 @@ class F3DViewer(Gtk.GLArea):
         self.distance = p_dist(self.camera.position, (0, 0, 0))
 
     def pan(self, x, y, z):
+        self.begin_interaction()
+        self.end_interaction(INTERACTION_IDLE_TIMEOUT)
+
         val = self.distance / 40
         self.camera.pan(x * val, y * val, z * val)
-        self.queue_render()
+        self.request_render()
 
     def pan_action(self, action, _, x, y, z):
         self.pan(x, y, z)
@@ -403,6 +1262,9 @@ class F3DViewer(Gtk.GLArea):
         self.tilt(direction)
 
     def tilt(self, direction):
+        self.begin_interaction()
+        self.end_interaction(INTERACTION_IDLE_TIMEOUT)
+
         val = self.distance / 40
 
         focal_point = self.camera.focal_point
@@ -433,37 +1295,49 @@ class F3DViewer(Gtk.GLArea):
             up = up_dirs_vector[self.settings["scene.up_direction"]]
             self.camera.view_up = up
 
-        self.queue_render()
+        self.request_render()
 
     def set_view_up(self, direction):
         self.camera.view_up = direction
-        self.queue_render()
+        self.request_render()
 
     def set_camera_state(self, state):
         self.camera.state = state
-        self.queue_render()
+        self.request_render()
 
     def get_camera_state(self):
         return self.camera.state
 
+    # None for perspective views, their zoom is part of the camera state
+    def get_view_height(self):
+        if not self.camera or not self.settings.get("scene.camera.orthographic"):
+            return None
+        return get_view_height(self.window, self.height)
+
     @Gtk.Template.Callback("on_scroll")
     def on_scroll(self, gesture, dx, dy):
+        self.begin_interaction()
+        self.end_interaction(INTERACTION_IDLE_TIMEOUT)
+
         if self.settings["scene.camera.orthographic"]:
             self.camera.zoom(1 - 0.1 * dy)
         else:
             self.camera.dolly(1 - 0.1 * dy)
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     @Gtk.Template.Callback("on_zoom_scale_changed")
     def on_zoom_scale_changed(self, zoom_gesture, scale):
+        self.begin_interaction()
         self.camera.dolly(1 - self.prev_scale + scale)
         self.prev_scale = scale
         self.get_distance()
-        self.queue_render()
+        self.request_render()
 
     @Gtk.Template.Callback("on_drag_update")
     def on_drag_update(self, gesture, x_offset, y_offset):
+        self.begin_interaction()
+
         if gesture.get_current_button() == 1:
             dist, direction = self.get_camera_to_focal_distance()
             y = -(self.drag_prev_offset[1] - y_offset) * 0.5
@@ -493,13 +1367,18 @@ class F3DViewer(Gtk.GLArea):
             up = up_dirs_vector[self.settings["scene.up_direction"]]
             self.camera.view_up = up
 
-        self.queue_render()
+        self.request_render()
 
         self.drag_prev_offset = (x_offset, y_offset)
 
     @Gtk.Template.Callback("on_drag_end")
     def on_drag_end(self, gesture, *args):
         self.drag_prev_offset = (0, 0)
+        self.end_interaction()
+
+    @Gtk.Template.Callback("on_zoom_end")
+    def on_zoom_end(self, gesture, *args):
+        self.end_interaction()
 
     def create_action(self, name, callback, *args):
         action = Gio.SimpleAction.new(name, None)
@@ -23,28 +23,82 @@ from gettext import gettext as _
 
 import os
 
+from ..texture_cache import TextureCache
 
-class ImageThumbnail(Gtk.FlowBoxChild):
+
+class SuggestedFile(GObject.Object):
+    __gtype_name__ = "SuggestedFile"
+
+    def __init__(self, filepath, thumbnail=None):
+        super().__init__()
+
+        self._filepath = filepath
+        self._thumbnail = thumbnail or ""
+
+    @GObject.Property(type=str)
+    def filepath(self) -> str:
+        return self._filepath
+
+    @GObject.Property(type=str)
+    def thumbnail(self) -> str:
+        return self._thumbnail
+
+    @thumbnail.setter
+    def thumbnail(self, value):
+        self._thumbnail = value
+
+
+class ImageThumbnail(Adw.Bin):
     __gtype_name__ = "ImageThumbnail"
 
-    def __init__(self, file_thumbnail, hdri_file):
+    def __init__(self):
         super().__init__()
 
-        self.hdri_file = hdri_file
+        self.item = None
+        self._handler = None
 
-        file = Gio.File.new_for_path(file_thumbnail)
-        image = Gtk.Picture(
-            file=file,
+        self.image = Gtk.Picture(
             css_classes=["suggested-picture"],
             hexpand=True,
             vexpand=True,
+            height_request=60,
             content_fit=Gtk.ContentFit.COVER,
         )
-        self.set_child(image)
+        self.set_child(self.image)
 
-        base_name = os.path.basename(hdri_file)
+    def bind_item(self, item):
+        self.item = item
+        self._handler = item.connect("notify::thumbnail", self.update_thumbnail)
+
+        base_name = os.path.basename(item.filepath)
         self.set_tooltip_text(base_name)
 
+        self.update_thumbnail()
+
+    def unbind_item(self):
+        if self.item:
+            self.item.disconnect(self._handler)
+        self.item = None
+        self._handler = None
+        self.image.set_paintable(None)
+
+    def update_thumbnail(self, *args):
+        self.image.set_paintable(None)
+
+        item = self.item
+        if not item or not item.thumbnail:
+            return
+
+        # The thumbnail is decoded only now that it's visible
+        TextureCache.get_default().load_async(
+            item.thumbnail,
+            lambda texture: self.on_texture_loaded(item, texture),
+        )
+
+    def on_texture_loaded(self, item, texture):
+        if texture and item is self.item:
+            self.image.set_paintable(texture)
+
 
 @Gtk.Template(resource_path="/io/github/nokse22/Exhibit/ui/file_row.ui")
 class FileRow(Adw.PreferencesRow):
@@ -60,6 +114,7 @@ class FileRow(Adw.PreferencesRow):
     delete_button = Gtk.Template.Child()
     drop_target = Gtk.Template.Child()
     suggestions_box = Gtk.Template.Child()
+    suggestions_grid = Gtk.Template.Child()
 
     filepath = ""
 
@@ -68,14 +123,23 @@ class FileRow(Adw.PreferencesRow):
 
         self.title = ""
 
-        self.suggested_files_n = 0
+        self.suggested_files = Gio.ListStore.new(SuggestedFile)
+
+        factory = Gtk.SignalListItemFactory()
+        factory.connect("setup", self.on_factory_setup)
+        factory.connect("bind", self.on_factory_bind)
+        factory.connect("unbind", self.on_factory_unbind)
+
+        self.suggestions_grid.set_factory(factory)
+        self.suggestions_grid.set_model(
+            Gtk.NoSelection.new(model=self.suggested_files))
 
         self.file_patterns = []
         self.window = None
 
         self.file_button.connect("clicked", self.on_open_clicked)
         self.delete_button.connect("clicked", self.on_delete_clicked)
-        self.suggestions_box.connect("child-activated", self.on_image_activated)
+        self.suggestions_grid.connect("activate", self.on_image_activated)
         self.drop_target.connect("drop", self.on_drop_received)
 
         self.drop_target.set_gtypes([Gdk.FileList])
@@ -109,17 +173,39 @@ class FileRow(Adw.PreferencesRow):
 
     def add_suggested_file(self, file_thumbnail, filepath):
         if os.path.isfile(filepath):
+            self.suggested_files.append(SuggestedFile(filepath, file_thumbnail))
             self.suggestions_box.set_visible(True)
 
-            hdri_thumbnail = ImageThumbnail(file_thumbnail, filepath)
-            self.suggestions_box.append(hdri_thumbnail)
+    def find_suggested_file(self, filepath):
+        for item in self.suggested_files:
+            if item.filepath == filepath:
+                return item
+        return None
+
+    def set_suggested_thumbnail(self, filepath, file_thumbnail):
+        item = self.find_suggested_file(filepath)
+        if item:
+            item.thumbnail = file_thumbnail
+
+    def remove_suggested_file(self, filepath):
+        item = self.find_suggested_file(filepath)
+        if item:
+            found, position = self.suggested_files.find(item)
+            if found:
+                self.suggested_files.remove(position)
+        self.suggestions_box.set_visible(self.suggested_files.get_n_items() != 0)
+
+    def on_factory_setup(self, factory, list_item):
+        list_item.set_child(ImageThumbnail())
+
+    def on_factory_bind(self, factory, list_item):
+        list_item.get_child().bind_item(list_item.get_item())
 
-            self.suggested_files_n += 1
-            height = ((self.suggested_files_n + 3) // 4) * 70
-            self.suggestions_box.set_size_request(-1, height)
+    def on_factory_unbind(self, factory, list_item):
+        list_item.get_child().unbind_item()
 
-    def on_image_activated(self, flow_box, child):
-        filepath = child.hdri_file
+    def on_image_activated(self, grid_view, position):
+        filepath = self.suggested_files.get_item(position).filepath
         self.set_filename(filepath)
         self.emit("file-added", filepath)
 
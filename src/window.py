@@ -18,18 +18,31 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
-import json
-import re
-import threading
+import csv
+import time
 
-from gi.repository import Adw, Gtk, Gdk, Gio, GLib, GObject
+from contextlib import contextmanager
+
+from gi.repository import Adw, Gtk, Gdk, Gio, GLib
 from .widgets import F3DViewer, FileRow
-from wand.image import Image
 
 from . import logger_lib
-from .settings_manager import WindowSettings
-
-import f3d
+from .settings_manager import WindowSettings, SettingType
+from .file_monitor import FileWatcher
+from .loader import (
+    FileLoader, PHASE_READ, PHASE_PARSE, PHASE_UPLOAD, PHASE_FIRST_FRAME)
+from .prefetch import ScenePrefetcher, list_directory_files
+from .thumbnail_cache import ThumbnailCache
+from .configurations import ConfigurationRegistry
+from .readers import get_allowed_extensions
+from .model_formats import count_elements
+from .render_stats import CSV_COLUMNS
+from .image_export import ImageExporter, ExportRequest
+from .frame_export import (
+    FrameExporter, FrameExportRequest, VIDEO_EXTENSIONS,
+    MODE_TURNTABLE, MODE_ANIMATION, MODE_CAMERA_PATH)
+from . import startup
+from . import tracing
 
 from gettext import gettext as _
 
@@ -60,42 +73,10 @@ up_dirs_vector = {
     "+Z": (0.0, 0.0, 1.0)
 }
 
-allowed_extensions = []
-
-for reader in f3d.Engine.get_readers_info():
-    # print(f"Reader: {reader.name}\nDescr: {reader.description}\nExt: {reader.extensions}\nMime: {reader.mime_types}\np name: {reader.plugin_name}\nscene: {reader.has_scene_reader}\ngeom: {reader.has_geometry_reader}\n\n")
-    # print(reader.has_scene_reader)
-    allowed_extensions += reader.extensions
-
-print(allowed_extensions)
 
 image_patterns = ["hdr", "exr", "png", "jpg", "pnm", "tiff", "bmp"]
 
 
-class PeriodicChecker(GObject.Object):
-    def __init__(self, function):
-        super().__init__()
-
-        self._running = False
-        self._function = function
-
-    def run(self):
-        if self._running:
-            return
-        self._running = True
-        GLib.timeout_add(500, self.periodic_check)
-
-    def stop(self):
-        self._running = False
-
-    def periodic_check(self):
-        if self._running:
-            self._function()
-            return True
-        else:
-            return False
-
-
 @Gtk.Template(resource_path='/io/github/nokse22/Exhibit/ui/window.ui')
 class Viewer3dWindow(Adw.ApplicationWindow):
     __gtype_name__ = 'Viewer3dWindow'
@@ -114,6 +95,8 @@ class Viewer3dWindow(Adw.ApplicationWindow):
     loading_drop_target = Gtk.Template.Child()
 
     toast_overlay = Gtk.Template.Child()
+    performance_hud = Gtk.Template.Child()
+    animation_frame_picture = Gtk.Template.Child()
 
     grid_switch = Gtk.Template.Child()
     absolute_grid_switch = Gtk.Template.Child()
@@ -176,10 +159,31 @@ class Viewer3dWindow(Adw.ApplicationWindow):
     save_settings_extensions_entry = Gtk.Template.Child()
     save_settings_expander = Gtk.Template.Child()
 
+    export_dialog = Gtk.Template.Child()
+    export_width_spin = Gtk.Template.Child()
+    export_height_spin = Gtk.Template.Child()
+    export_supersampling_spin = Gtk.Template.Child()
+    export_viewer_size_button = Gtk.Template.Child()
+    export_button = Gtk.Template.Child()
+
+    frames_dialog = Gtk.Template.Child()
+    frames_mode_row = Gtk.Template.Child()
+    camera_path_row = Gtk.Template.Child()
+    camera_path_add_button = Gtk.Template.Child()
+    camera_path_clear_button = Gtk.Template.Child()
+    frames_count_spin = Gtk.Template.Child()
+    frames_rate_spin = Gtk.Template.Child()
+    frames_width_spin = Gtk.Template.Child()
+    frames_height_spin = Gtk.Template.Child()
+    frames_supersampling_spin = Gtk.Template.Child()
+    frames_export_button = Gtk.Template.Child()
+
     animation_group = Gtk.Template.Child()
     animation_time_adj = Gtk.Template.Child()
     animation_index_adj = Gtk.Template.Child()
     play_button = Gtk.Template.Child()
+    loop_button = Gtk.Template.Child()
+    playback_speed_adj = Gtk.Template.Child()
 
     width = 600
     height = 600
@@ -189,10 +193,10 @@ class Viewer3dWindow(Adw.ApplicationWindow):
     filepath = ""
     no_file_loaded = True
 
-    _cached_time_stamp = 0
-
-    def __init__(self, application=None, startup_filepath=None):
-        super().__init__(application=application)
+    def __init__(self, application=None, startup_filepath=None,
+                 extra_filepaths=()):
+        with tracing.span("window-template"):
+            super().__init__(application=application)
 
         self.logger = logger_lib.logger
 
@@ -206,7 +210,8 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
         # Defining all the actions
         self.save_as_action = self.create_action(
-            'save-as-image', self.open_save_file_chooser)
+            'save-as-image', self.open_export_dialog)
+        self.create_action('export-frames', self.open_frames_dialog)
         self.open_new_action = self.create_action(
             'open-new', self.open_file_chooser)
         self.open_new_action = self.create_action(
@@ -236,9 +241,98 @@ class Viewer3dWindow(Adw.ApplicationWindow):
             'save-settings', self.on_save_settings)
         self.save_settings_action.set_enabled(False)
 
-        # Initialize the change checker
-        self.change_checker = PeriodicChecker(
-            self.periodic_check_for_file_change)
+        self.next_file_action = self.create_action(
+            'next-file', lambda *_: self.step_directory_file(1))
+        self.previous_file_action = self.create_action(
+            'previous-file', lambda *_: self.step_directory_file(-1))
+        self.next_file_action.set_enabled(False)
+        self.previous_file_action.set_enabled(False)
+
+        self.browse_directory_action = Gio.SimpleAction.new_stateful(
+            "browse-directory",
+            None,
+            GLib.Variant(
+                "b", self.saved_settings.get_boolean("browse-directory")))
+        self.browse_directory_action.connect(
+            "change-state", self.on_browse_directory_state_changed)
+        self.add_action(self.browse_directory_action)
+
+        # Reduce the rendering quality while moving the camera
+        self.add_action(self.saved_settings.create_action("adaptive-quality"))
+        self.saved_settings.bind(
+            "adaptive-quality", self.f3d_viewer, "adaptive-quality",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.bind(
+            "target-frame-time", self.f3d_viewer, "target-frame-time",
+            Gio.SettingsBindFlags.GET)
+
+        # Large point clouds are reduced to a budget of points
+        self.add_action(self.saved_settings.create_action("reduce-point-clouds"))
+        self.saved_settings.bind(
+            "reduce-point-clouds", self.f3d_viewer, "reduce-point-clouds",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.bind(
+            "point-budget", self.f3d_viewer, "point-budget",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.connect(
+            "changed::reduce-point-clouds", self.on_point_budget_changed)
+        self.saved_settings.connect(
+            "changed::point-budget", self.on_point_budget_changed)
+
+        # Text models are converted to binary to load faster the next time
+        self.add_action(self.saved_settings.create_action("scene-cache"))
+        self.saved_settings.bind(
+            "scene-cache", self.f3d_viewer, "scene-cache",
+            Gio.SettingsBindFlags.GET)
+
+        # Big models are replaced by a simplified copy while moving
+        self.add_action(self.saved_settings.create_action("mesh-proxy"))
+        self.saved_settings.bind(
+            "mesh-proxy", self.f3d_viewer, "mesh-proxy",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.bind(
+            "mesh-proxy-threshold", self.f3d_viewer, "mesh-proxy-threshold",
+            Gio.SettingsBindFlags.GET)
+
+        # Keep rendered animation frames to scrub without rendering
+        self.add_action(self.saved_settings.create_action("animation-cache"))
+        self.saved_settings.bind(
+            "animation-cache", self.f3d_viewer, "animation-cache-enabled",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.bind(
+            "animation-cache-rate", self.f3d_viewer, "animation-cache-rate",
+            Gio.SettingsBindFlags.GET)
+        self.saved_settings.bind(
+            "animation-cache-memory-budget", self.f3d_viewer,
+            "animation-cache-memory-budget", Gio.SettingsBindFlags.GET)
+
+        self.performance_hud_action = Gio.SimpleAction.new_stateful(
+            "performance-hud", None, GLib.Variant("b", False))
+        self.performance_hud_action.connect(
+            "change-state", self.on_performance_hud_state_changed)
+        self.add_action(self.performance_hud_action)
+        self.performance_hud_source = None
+
+        self.create_action(
+            'export-statistics', self.open_export_statistics_file_chooser)
+
+        # Points and faces of the loaded files, None when unknown
+        self.scene_counts = (None, None)
+
+        # Initialize the file watcher
+        self.file_watcher = FileWatcher()
+        self.file_watcher.connect("changed", self.on_watched_files_changed)
+
+        # Initialize the loader, it runs all the loads on one thread
+        self.loader = FileLoader(self._load_file)
+        self.loader.connect("progress", self.on_load_progress)
+        self.f3d_viewer.connect("first-frame", self.on_first_frame)
+        self.f3d_viewer.connect("cached-frame", self.on_cached_frame)
+
+        # Initialize the prefetcher used when browsing a directory
+        self.prefetcher = ScenePrefetcher(
+            self.f3d_viewer.create_engine,
+            self.saved_settings.get_int("prefetch-memory-budget") * 1024 * 1024)
 
         # Saving all the useful paths
         data_home = os.environ["XDG_DATA_HOME"]
@@ -246,16 +340,18 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.hdri_path = data_home + "/HDRIs/"
         self.hdri_thumbnails_path = self.hdri_path + "/thumbnails/"
 
-        self.user_configurations_path = data_home + "/configurations/"
-
-        os.makedirs(self.user_configurations_path, exist_ok=True)
         os.makedirs(data_home + "/other files/", exist_ok=True)
 
         # Create the hdri folder and add the default if there are none
-        self.setup_hdri_folder()
+        with tracing.span("setup-hdri-folder"):
+            self.setup_hdri_folder()
 
-        # Loading the saved configurations
-        self.setup_configurations()
+        # The configurations are loaded once and shared by all the windows
+        self.configuration_registry = ConfigurationRegistry.get_default()
+        with tracing.span("setup-configurations"):
+            self.setup_configurations()
+        self.configurations_handler = self.configuration_registry.connect(
+            "changed", self.on_configurations_changed)
 
         # Setting drop target type
         self.view_drop_target.set_gtypes([Gdk.FileList])
@@ -276,17 +372,29 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.hdri_file_row.file_patterns = image_patterns
         self.hdri_file_row.window = self
 
+        # Placeholders are shown until the thumbnails are generated
+        hdri_files = []
         for filename in list_files(self.hdri_path):
-            name, _ = os.path.splitext(filename)
-
-            thumbnail = self.hdri_thumbnails_path + name + ".jpeg"
-            filepath = self.hdri_path + filename
-            try:
-                if not os.path.isfile(thumbnail):
-                    thumbnail = self.generate_thumbnail(filepath)
-                self.hdri_file_row.add_suggested_file(thumbnail, filepath)
-            except Exception:
-                self.logger.warning(f"Couldn't open HDRI file {filepath}, skipping")
+            extension = os.path.splitext(filename)[1][1:].lower()
+            if extension in image_patterns:
+                filepath = self.hdri_path + filename
+                hdri_files.append(filepath)
+                self.hdri_file_row.add_suggested_file(None, filepath)
+
+        self.thumbnail_cache = ThumbnailCache.get_default(
+            self.hdri_thumbnails_path)
+        self.thumbnail_handlers = [
+            self.thumbnail_cache.connect(
+                "thumbnail-ready",
+                lambda cache, filepath, thumbnail:
+                    self.hdri_file_row.set_suggested_thumbnail(
+                        filepath, thumbnail)),
+            self.thumbnail_cache.connect(
+                "thumbnail-failed",
+                lambda cache, filepath:
+                    self.hdri_file_row.remove_suggested_file(filepath)),
+        ]
+        self.thumbnail_cache.request(hdri_files)
 
         if self.window_settings.get_setting("orthographic").value:
             self.f3d_viewer.orthographic = self.window_settings.get_setting("orthographic").value
@@ -326,6 +434,49 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.save_settings_extensions_entry.connect(
             "changed", self.on_save_settings_extensions_entry_changed)
 
+        # Images are exported on a thread, the progress is shown in a toast
+        self.image_exporter = ImageExporter()
+        self.image_exporter.connect("progress", self.on_export_progress)
+        self.image_exporter.connect("finished", self.on_export_finished)
+        self.image_exporter.connect("failed", self.on_export_failed)
+        self.frame_exporter = FrameExporter()
+        self.frame_exporter.connect("progress", self.on_export_progress)
+        self.frame_exporter.connect(
+            "finished", self.on_frames_export_finished)
+        self.frame_exporter.connect("failed", self.on_export_failed)
+        self.export_toast = None
+        self.export_toast_title = ""
+
+        # Views the camera goes through when exporting a camera path
+        self.camera_path = []
+
+        for key, spin in (
+            ("export-width", self.export_width_spin),
+            ("export-height", self.export_height_spin),
+            ("export-supersampling", self.export_supersampling_spin),
+            ("export-width", self.frames_width_spin),
+            ("export-height", self.frames_height_spin),
+            ("export-supersampling", self.frames_supersampling_spin),
+            ("frames-export-count", self.frames_count_spin),
+            ("frames-export-rate", self.frames_rate_spin),
+        ):
+            self.saved_settings.bind(
+                key, spin, "value", Gio.SettingsBindFlags.DEFAULT)
+
+        self.export_viewer_size_button.connect(
+            "clicked", self.on_export_viewer_size_clicked)
+        self.export_button.connect("clicked", self.open_save_file_chooser)
+
+        self.frames_mode_row.connect(
+            "notify::selected", self.on_frames_mode_changed)
+        self.camera_path_add_button.connect(
+            "clicked", self.on_camera_path_add_clicked)
+        self.camera_path_clear_button.connect(
+            "clicked", self.on_camera_path_clear_clicked)
+        self.frames_export_button.connect(
+            "clicked", self.open_frames_file_chooser)
+        self.update_camera_path_row()
+
         # Setting the UI and connecting widgets
         self.window_settings.connect(
             "changed-other", self.on_other_setting_changed)
@@ -333,6 +484,8 @@ class Viewer3dWindow(Adw.ApplicationWindow):
             "changed-internal", self.on_internal_setting_changed)
         self.window_settings.connect(
             "changed-view", self.on_view_setting_changed)
+        self.window_settings.connect(
+            "changed-batch", self.on_settings_batch_changed)
 
         # Switches signals
         switches = [
@@ -427,6 +580,11 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
         self.play_button.connect("clicked", self.on_play_button_clicked)
 
+        self.loop_button.bind_property(
+            "active", self.f3d_viewer, "loop", 3)
+        self.playback_speed_adj.bind_property(
+            "value", self.f3d_viewer, "playback-speed", 3)
+
         self.f3d_viewer.connect("notify::playing", self.on_playing_changed)
 
         self.animation_index_adj.connect_after(
@@ -435,45 +593,28 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.block_reload = True
 
         # Sync the UI with the settings
-        self.window_settings.sync_all_settings()
+        with self.f3d_viewer.batch_options():
+            with tracing.span("sync-all-settings"):
+                self.window_settings.sync_all_settings()
 
         self.block_reload = False
 
         if startup_filepath:
             self.logger.info(f"startup file detected: {startup_filepath}")
-            self.load_file(filepath=startup_filepath)
+            self.load_file(
+                filepath=startup_filepath, extra_files=list(extra_filepaths))
 
         self.logger.info("Started")
 
+        startup.mark("window")
+        if not startup_filepath:
+            startup.finish("idle")
+
     def setup_configurations(self):
-        self.configurations = Gio.resources_lookup_data(
-            '/io/github/nokse22/Exhibit/configurations.json',
-            Gio.ResourceLookupFlags.NONE).get_data().decode('utf-8')
-        self.configurations = json.loads(self.configurations)
-
-        for filename in os.listdir(self.user_configurations_path):
-            if filename.endswith('.json'):
-                filepath = os.path.join(
-                    self.user_configurations_path, filename)
-                with open(filepath, 'r') as file:
-                    try:
-                        configuration = json.load(file)
-
-                        # Check if the loaded configurations
-                        #   has all the required keys
-                        required_keys = {
-                            "name", "formats",
-                            "view-settings", "other-settings"
-                        }
-                        first_key_value = next(iter(configuration.values()))
-                        if required_keys.issubset(first_key_value.keys()):
-                            self.configurations.update(configuration)
-                        else:
-                            self.logger.error(
-                                f"Error: {filepath} is missing required keys.")
-
-                    except json.JSONDecodeError as e:
-                        self.logger.error(f"Error reading {filename}: {e}")
+        self.configurations = self.configuration_registry.configurations
+        self.preset_index = self.configuration_registry.preset_index
+
+        self.settings_section.remove_all()
 
         item = Gio.MenuItem.new("Custom", "win.settings")
         item.set_attribute_value("target", GLib.Variant.new_string("custom"))
@@ -484,6 +625,13 @@ class Viewer3dWindow(Adw.ApplicationWindow):
             item.set_attribute_value("target", GLib.Variant.new_string(key))
             self.settings_section.append_item(item)
 
+    def on_configurations_changed(self, registry):
+        self.setup_configurations()
+
+        state = self.settings_action.get_state().get_string()
+        if state != "custom" and state not in self.configurations:
+            self.change_setting_state(GLib.Variant("s", "custom"))
+
     def setup_hdri_folder(self):
         if os.path.isdir(self.hdri_path):
             return
@@ -616,14 +764,12 @@ class Viewer3dWindow(Adw.ApplicationWindow):
                 "bg-color": self.window_settings.get_setting("bg-color").value,
             }
             self.f3d_viewer.update_options(options)
-            GLib.idle_add(self.f3d_viewer.queue_render)
             return
         if self.style_manager.get_dark():
             options = {"bg-color": [0.117, 0.117, 0.117]}
         else:
             options = {"bg-color": [1.0, 1.0, 1.0]}
         self.f3d_viewer.update_options(options)
-        GLib.idle_add(self.f3d_viewer.queue_render)
 
     # Functions to set the settings
 
@@ -638,6 +784,10 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
     def on_other_setting_changed(self, window_settings, setting):
         self.logger.info(f"Setting: {setting.name} to {setting.value}")
+        self.apply_other_setting(setting)
+        self.check_for_options_change()
+
+    def apply_other_setting(self, setting):
         if setting.name == "use-color":
             self.update_background_color()
         elif setting.name == "point-up":
@@ -650,12 +800,35 @@ class Viewer3dWindow(Adw.ApplicationWindow):
                 self.f3d_viewer.always_point_up = False
         elif setting.name == "auto-reload":
             if setting.value:
-                self.change_checker.run()
+                self.file_watcher.watch(self.f3d_viewer.loaded_files)
             else:
-                self.change_checker.stop()
+                self.file_watcher.stop()
+
+    def on_settings_batch_changed(self, window_settings, settings):
+        self.logger.info(f"Settings changed: {settings}")
+
+        options = {}
+        for setting in settings:
+            if setting.type == SettingType.VIEW:
+                options[setting.name] = setting.value
+        self.f3d_viewer.update_options(options)
+
+        for setting in settings:
+            if setting.type == SettingType.OTHER:
+                self.apply_other_setting(setting)
 
         self.check_for_options_change()
 
+        if "up" in options:
+            self.reload_file()
+
+    # Changes to the settings made inside are applied to the viewer at once
+    @contextmanager
+    def settings_transaction(self):
+        with self.f3d_viewer.batch_options():
+            with self.window_settings.transaction():
+                yield
+
     def on_internal_setting_changed(self, window_settings, setting):
         self.logger.info(f"Setting: {setting.name} to {setting.value}")
         if setting.name == "auto-best":
@@ -676,24 +849,15 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         key = name.lower().replace(' ', '_')
 
         # Construct the dictionary
-        settings_dict = {
-            key: {
-                "name": name,
-                "formats": f".*({formats.replace(', ', '|')})",
-                "view-settings": view_settings,
-                "other-settings": other_settings
-            }
+        configuration = {
+            "name": name,
+            "formats": f".*({formats.replace(', ', '|')})",
+            "view-settings": view_settings,
+            "other-settings": other_settings
         }
 
-        # Save to JSON file
-        with open(self.user_configurations_path + key + '.json', 'w') as j_f:
-            json.dump(settings_dict, j_f, indent=4)
-
-        # Update configurations and menu UI
-        self.configurations.update(settings_dict)
-        item = Gio.MenuItem.new(name, "win.settings")
-        item.set_attribute_value("target", GLib.Variant.new_string(key))
-        self.settings_section.append_item(item)
+        # Save to JSON file, all the windows will update their menu
+        self.configuration_registry.save(key, configuration)
 
         self.save_dialog.close()
 
@@ -712,6 +876,7 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
         entered_exts = [ext.strip() for ext in extensions_text.split(',')]
 
+        allowed_extensions = get_allowed_extensions()
         if all(ext in allowed_extensions for ext in entered_exts):
             entry.remove_css_class("error")
         else:
@@ -728,21 +893,27 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         if name == "custom":
             return
 
+        start_time = time.perf_counter()
+
         # Get the default settings and change the ones defined by the chosen presets
         options = self.window_settings.get_default_user_customizable_settings()
         for key, value in self.configurations[name]["view-settings"].items():
             options[key] = value
 
-        # Set all the settings
-        for key, value in options.items():
-            self.window_settings.set_setting(key, value)
+        with self.settings_transaction():
+            # Set all the settings
+            for key, value in options.items():
+                self.window_settings.set_setting(key, value)
 
-        # Update all the viewer settings, to support settings without UI
-        self.f3d_viewer.update_options(options)
+            # Update all the viewer settings, to support settings without UI
+            self.f3d_viewer.update_options(options)
+
+            # Set all the settings not related to the viewer
+            for key, value in self.configurations[name]["other-settings"].items():
+                self.window_settings.set_setting(key, value)
 
-        # Set all the settings not related to the viewer
-        for key, value in self.configurations[name]["other-settings"].items():
-            self.window_settings.set_setting(key, value)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        self.logger.debug(f"Applied the {name} configuration in {elapsed:.2f} ms")
 
     def check_for_options_change(self):
         if self.block_reload:
@@ -754,6 +925,8 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
         self.logger.debug(f"Checking for changed options from {state_name}")
 
+        start_time = time.perf_counter()
+
         state_options = self.window_settings.get_default_user_customizable_settings()
 
         for key, value in self.configurations[state_name]["view-settings"].items():
@@ -771,28 +944,19 @@ class Viewer3dWindow(Adw.ApplicationWindow):
                     self.change_setting_state(GLib.Variant("s", "custom"))
                     return
 
-    def periodic_check_for_file_change(self):
-        if self.filepath == "":
-            return True
-
-        changed = self.update_time_stamp()
-        if changed:
-            self.logger.debug("file changed")
-            self.load_file(preserve_orientation=True, override=True)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        self.logger.debug(f"Options unchanged, checked in {elapsed:.2f} ms")
 
-        if self.window_settings.get_setting("auto-reload").value:
-            return True
-        return False
+    def on_watched_files_changed(self, file_watcher, changed_files):
+        if self.filepath == "":
+            return
 
-    def update_time_stamp(self):
-        try:
-            stamp = os.stat(self.filepath).st_mtime
-            if stamp != self._cached_time_stamp:
-                self._cached_time_stamp = stamp
-                return True
-            return False
-        except Exception:
-            return False
+        self.logger.debug(f"files changed: {changed_files}")
+        self.load_file(
+            filepath=self.filepath,
+            preserve_orientation=True,
+            override=True,
+            incremental=True)
 
     def change_setting_state(self, state):
         self.logger.debug(f"Requested changing settings to {state}")
@@ -802,13 +966,15 @@ class Viewer3dWindow(Adw.ApplicationWindow):
             self.settings_action.set_state(state)
             return
 
-        self.set_settings_from_name(state.get_string())
+        # The changes are checked against the new state when committed
+        with self.settings_transaction():
+            self.set_settings_from_name(state.get_string())
 
-        self.settings_action.set_state(state)
+            self.settings_action.set_state(state)
 
-        self.save_settings_action.set_enabled(False)
+            self.save_settings_action.set_enabled(False)
 
-        self.update_background_color()
+            self.update_background_color()
 
     def get_gimble_limit(self):
         return self.distance / 10
@@ -816,7 +982,7 @@ class Viewer3dWindow(Adw.ApplicationWindow):
     def open_file_chooser(self, *args):
         file_filter = Gtk.FileFilter(name=_("All supported formats"))
 
-        for patt in allowed_extensions:
+        for patt in get_allowed_extensions():
             file_filter.add_pattern("*." + patt)
 
         filter_list = Gio.ListStore.new(Gtk.FileFilter())
@@ -841,79 +1007,244 @@ class Viewer3dWindow(Adw.ApplicationWindow):
             self.load_file(filepath=filepath)
 
     def load_file(self, **kwargs):
+        filepath = kwargs.get("filepath", None)
+        if filepath is None:
+            filepath = self.filepath
+            kwargs["filepath"] = filepath
+
         self.startup_stack.set_visible_child_name("loading_page")
         self.stack.set_visible_child_name("startup_page")
         self.loading_label.set_label(
-            _("Loading {}").format(
-                os.path.basename(kwargs.get("filepath", "Nothing"))))
+            _("Loading {}").format(os.path.basename(filepath)))
         self.block_reload = True
-        self.f3d_viewer.initialize()
-        GLib.timeout_add(
-            100,
-            lambda *args: threading.Thread(
-                target=self._load_file, kwargs=(kwargs)).start())
+        self.file_watcher.stop()
 
-    def _load_file(self, **kwargs):
-        filepath = kwargs.get("filepath", None)
-        override = kwargs.get("override", False)
-        preserve_orientation = kwargs.get("preserve_orientation", False)
-        add_file = kwargs.get("add_file", False)
+        # The best settings are chosen here, the loader thread must not
+        #   touch the UI
+        if (self.window_settings.get_setting("auto-best").value
+                and not kwargs.get("override", False)
+                and not kwargs.get("add_file", False)
+                and filepath):
+            self.logger.debug("choosing best settings")
+            settings = self.get_best_configuration(filepath)
+            self.logger.debug(f"best settings is {settings}")
+            self.change_setting_state(GLib.Variant("s", settings))
 
-        if preserve_orientation:
-            camera_state = self.f3d_viewer.get_camera_state()
+        # The engine is bound to the GL context and the camera is read
+        #   here, they can't be touched from the loader thread
+        engine_created = self.f3d_viewer.ensure_engine()
+        self.f3d_viewer.start_load_measurement(engine_created)
 
-        if filepath is None:
-            filepath = self.filepath
+        if kwargs.get("preserve_orientation", False):
+            kwargs["camera_state"] = self.f3d_viewer.get_camera_state()
+
+        self.loader.submit(**kwargs)
 
-        if filepath == "" or filepath is None:
+    def get_best_configuration(self, filepath):
+        self.logger.debug(
+            f"Configuration for {filepath}: "
+            f"{self.preset_index.explain(filepath)}")
+        return self.preset_index.get_best(filepath)
+
+    def _load_file(self, request):
+        filepath = request.filepath
+        add_file = request.kwargs.get("add_file", False)
+        incremental = request.kwargs.get("incremental", False)
+        extra_files = request.kwargs.get("extra_files", [])
+
+        if filepath == "":
             return
 
         self.logger.debug(
             f"load file: {filepath}")
 
-        self.change_checker.stop()
+        self.loader.report(request, PHASE_READ)
 
-        if (self.window_settings.get_setting("auto-best").value
-                and not override) and not add_file:
-            self.logger.debug("choosing best settings")
-            settings = "general"
-            for key, value in self.configurations.items():
-                pattern = value["formats"]
-                if pattern == ".*()":
-                    continue
-                if re.search(pattern, filepath):
-                    settings = key
-            self.logger.debug(f"best settings is {settings}")
-            self.change_setting_state(GLib.Variant("s", settings))
+        with self.f3d_viewer.scene_lock:
+            if self.loader.is_cancelled(request):
+                self.logger.debug(f"Skipping cancelled {request}")
+                return
+
+            if not incremental and not self.f3d_viewer.supports(filepath):
+                GLib.idle_add(self.on_file_not_opened, filepath, request)
+                return
 
-        if self.f3d_viewer.supports(filepath):
-            if add_file:
+            self.loader.report(request, PHASE_PARSE)
+
+            if incremental:
+                result = self.f3d_viewer.reload_files()
+                if result is None:
+                    GLib.idle_add(self.on_file_not_opened, filepath, request)
+                    return
+                changed, unchanged = result
+                if changed and unchanged:
+                    GLib.idle_add(
+                        self.send_toast,
+                        _("Reloaded {} of {} files").format(
+                            len(changed), len(changed) + len(unchanged)))
+            elif add_file:
                 if not self.f3d_viewer.add_file(filepath):
-                    GLib.idle_add(self.on_file_not_opened, filepath)
+                    GLib.idle_add(self.on_file_not_opened, filepath, request)
                     return
             else:
-                if not self.f3d_viewer.load_file(filepath):
-                    GLib.idle_add(self.on_file_not_opened, filepath)
+                # Prefetched scenes always have the whole file
+                engine = None
+                self.f3d_viewer.get_scene_path(filepath)
+                if filepath not in self.f3d_viewer.reduced_files:
+                    engine = self.prefetcher.take(
+                        filepath, self.f3d_viewer.settings)
+                if engine:
+                    self.f3d_viewer.use_engine(engine, filepath)
+                elif not self.f3d_viewer.load_file(filepath):
+                    GLib.idle_add(self.on_file_not_opened, filepath, request)
                     return
+
+            # Files opened together are added to the same scene
+            failed = []
+            for extra_file in extra_files:
+                if self.loader.is_cancelled(request):
+                    break
+                self.loader.report(request, PHASE_PARSE, extra_file)
+                if not self.f3d_viewer.add_file(extra_file):
+                    failed.append(extra_file)
+            if failed:
+                GLib.idle_add(
+                    self.send_toast,
+                    _("Couldn't open {} of {} files").format(
+                        len(failed), len(extra_files) + 1))
+
+            # A newer request is waiting, it will replace this scene
+            if self.loader.is_cancelled(request):
+                self.logger.debug(f"Dropping the result of {request}")
+                return
+
+        self.loader.report(request, PHASE_UPLOAD)
+
+        reduced = self.f3d_viewer.get_reduced_files()
+        if reduced:
+            GLib.idle_add(
+                self.send_toast,
+                _("Showing {} reduced to the point budget").format(
+                    os.path.basename(reduced[0])))
+
+        GLib.idle_add(self.on_file_opened, filepath, request)
+
+    def on_load_progress(self, loader, phase, filepath):
+        self.logger.debug(f"Loading phase {phase}: {filepath}")
+
+        labels = {
+            PHASE_READ: _("Reading {}"),
+            PHASE_PARSE: _("Loading {}"),
+            PHASE_UPLOAD: _("Uploading {}"),
+        }
+        if phase in labels:
+            self.loading_label.set_label(
+                labels[phase].format(os.path.basename(filepath)))
+
+    def on_first_frame(self, f3d_viewer, elapsed):
+        startup.finish("first-frame")
+
+        self.loader.emit("progress", PHASE_FIRST_FRAME, self.filepath)
+
+        if self.browse_directory_action.get_state().get_boolean():
+            self.prefetch_neighbour_files()
+
+    def on_point_budget_changed(self, settings, key):
+        if self.filepath == "":
+            return
+
+        self.load_file(
+            filepath=self.filepath,
+            preserve_orientation=True,
+            override=True)
+
+    def on_cached_frame(self, f3d_viewer, texture):
+        self.animation_frame_picture.set_paintable(texture)
+        self.animation_frame_picture.set_visible(texture is not None)
+
+    # Functions related to browsing the directory of the loaded file
+
+    def get_directory_files(self):
+        if self.filepath == "":
+            return []
+        return list_directory_files(self.filepath, get_allowed_extensions())
+
+    def step_directory_file(self, step):
+        files = self.get_directory_files()
+        if self.filepath not in files:
+            return
+
+        index = files.index(self.filepath) + step
+        if 0 <= index < len(files):
+            self.load_file(filepath=files[index])
+
+    def prefetch_neighbour_files(self):
+        files = self.get_directory_files()
+        if self.filepath not in files:
+            return
+
+        # Interleave the next and previous files, the next ones first
+        index = files.index(self.filepath)
+        neighbours = []
+        for distance in range(
+                1, self.saved_settings.get_int("prefetch-count") + 1):
+            for neighbour_index in (index + distance, index - distance):
+                if 0 <= neighbour_index < len(files):
+                    neighbours.append(files[neighbour_index])
+
+        prefetch_options = []
+        for filepath in neighbours:
+            options = dict(self.f3d_viewer.settings)
+            if self.window_settings.get_setting("auto-best").value:
+                configuration = self.configurations[
+                    self.get_best_configuration(filepath)]
+                up = configuration["view-settings"].get(
+                    "up", WindowSettings.default_settings["up"])
+                options[F3DViewer.keys["up"]] = up
+            prefetch_options.append((filepath, options))
+
+        self.prefetcher.prefetch(prefetch_options)
+
+    def update_directory_actions(self):
+        files = self.get_directory_files()
+        if self.filepath in files:
+            index = files.index(self.filepath)
+            self.previous_file_action.set_enabled(index > 0)
+            self.next_file_action.set_enabled(index < len(files) - 1)
+        else:
+            self.previous_file_action.set_enabled(False)
+            self.next_file_action.set_enabled(False)
+
+    def on_browse_directory_state_changed(self, action, state):
+        action.set_state(state)
+        self.saved_settings.set_boolean("browse-directory", state.get_boolean())
+        if state.get_boolean():
+            self.prefetch_neighbour_files()
         else:
-            GLib.idle_add(self.on_file_not_opened, filepath)
+            self.prefetcher.clear()
+
+    def on_file_opened(self, filepath, request):
+        if self.loader.is_cancelled(request):
             return
 
-        if preserve_orientation:
-            self.f3d_viewer.set_camera_state(camera_state)
+        self.logger.debug("on file opened")
 
         self.filepath = filepath
-        GLib.idle_add(self.on_file_opened)
 
-    def on_file_opened(self):
-        self.logger.debug("on file opened")
+        camera_state = request.kwargs.get("camera_state")
+        if camera_state is not None:
+            self.f3d_viewer.set_camera_state(camera_state)
 
-        self.update_time_stamp()
         if self.window_settings.get_setting("auto-reload").value:
-            self.change_checker.run()
+            self.file_watcher.watch(self.f3d_viewer.loaded_files)
 
         self.file_name = os.path.basename(self.filepath)
 
+        self.scene_counts = self.count_scene_elements()
+        self.f3d_viewer.render_stats.clear()
+
+        self.update_directory_actions()
+
         self.set_title(_("Exhibit - {}").format(self.file_name))
         self.title_widget.set_subtitle(self.file_name)
         self.stack.set_visible_child_name("3d_page")
@@ -931,7 +1262,10 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.block_reload = False
         GLib.timeout_add(100, self.f3d_viewer.done)
 
-    def on_file_not_opened(self, filepath):
+    def on_file_not_opened(self, filepath, request):
+        if self.loader.is_cancelled(request):
+            return
+
         self.logger.debug("on file not opened")
 
         self.set_title(_("Exhibit"))
@@ -950,33 +1284,280 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.toast_overlay.add_toast(toast)
 
     def save_as_image(self, filepath):
-        img = self.f3d_viewer.render_image()
-        img.save(filepath)
+        animation_time = None
+        if (self.f3d_viewer.upper_time_range
+                > self.f3d_viewer.lower_time_range):
+            animation_time = self.f3d_viewer.animation_time
+
+        request = ExportRequest(
+            filepath,
+            self.f3d_viewer.get_scene_paths(self.f3d_viewer.loaded_files),
+            self.f3d_viewer.settings,
+            self.f3d_viewer.get_camera_state(),
+            animation_time,
+            int(self.export_width_spin.get_value()),
+            int(self.export_height_spin.get_value()),
+            int(self.export_supersampling_spin.get_value()),
+            self.f3d_viewer.get_view_height())
+
+        self.start_export(self.image_exporter, request, _("Exporting Image"))
+
+    # Only one export runs at a time, so that they share the toast
+    def start_export(self, exporter, request, title):
+        if self.image_exporter.running or self.frame_exporter.running:
+            self.send_toast(_("Another export is running"))
+            return
+
+        exporter.export(request)
+
+        self.export_toast_title = title
+        self.export_toast = Adw.Toast(
+            title=title,
+            timeout=0,
+            button_label=_("Cancel"))
+        self.export_toast.connect(
+            "button-clicked", lambda *_: exporter.cancel())
+        self.toast_overlay.add_toast(self.export_toast)
+
+    def on_export_progress(self, exporter, fraction):
+        if self.export_toast:
+            self.export_toast.set_title(
+                f"{self.export_toast_title} {int(fraction * 100)}%")
+
+    def on_export_finished(self, exporter, file_path):
+        if self.export_toast:
+            self.export_toast.dismiss()
+            self.export_toast = None
+
+        toast = Adw.Toast(
+            title=_("Image Saved"),
+            timeout=2,
+            button_label=_("Open"),
+            action_name="app.show-image-externally",
+            action_target=GLib.Variant("s", file_path)
+        )
+        self.toast_overlay.add_toast(toast)
+
+    def on_export_failed(self, exporter, message):
+        if self.export_toast:
+            self.export_toast.dismiss()
+            self.export_toast = None
+
+        self.send_toast(_("Couldn't save the image: {}").format(message))
+
+    def open_export_dialog(self, *args):
+        self.export_dialog.present(self)
+
+    # Functions related to exporting frames
+
+    def open_frames_dialog(self, *args):
+        self.frames_dialog.present(self)
+
+    def get_frames_mode(self):
+        return (MODE_TURNTABLE, MODE_ANIMATION, MODE_CAMERA_PATH)[
+            self.frames_mode_row.get_selected()]
+
+    def on_frames_mode_changed(self, row, pspec):
+        mode = self.get_frames_mode()
+        self.camera_path_row.set_visible(mode == MODE_CAMERA_PATH)
+        # The animation is exported in real time
+        self.frames_count_spin.set_sensitive(mode != MODE_ANIMATION)
+
+    def on_camera_path_add_clicked(self, button):
+        self.camera_path.append(self.f3d_viewer.get_camera_state())
+        self.update_camera_path_row()
+
+    def on_camera_path_clear_clicked(self, button):
+        self.camera_path = []
+        self.update_camera_path_row()
+
+    def update_camera_path_row(self):
+        self.camera_path_row.set_subtitle(
+            _("{} views").format(len(self.camera_path)))
+        self.camera_path_clear_button.set_sensitive(bool(self.camera_path))
+
+    def open_frames_file_chooser(self, *args):
+        mode = self.get_frames_mode()
+        lower = self.f3d_viewer.lower_time_range
+        upper = self.f3d_viewer.upper_time_range
+        if mode == MODE_ANIMATION and upper <= lower:
+            self.send_toast(_("The file has no animation"))
+            return
+        if mode == MODE_CAMERA_PATH and len(self.camera_path) < 2:
+            self.send_toast(_("A camera path needs at least two views"))
+            return
+
+        self.frames_dialog.close()
+
+        extension = ".png"
+        if GLib.find_program_in_path("ffmpeg"):
+            extension = "." + VIDEO_EXTENSIONS[0]
 
-    def open_save_file_chooser(self, *args):
         dialog = Gtk.FileDialog(
             title=_("Save File"),
-            initial_name=self.file_name.split(".")[0] + ".png",
+            initial_name=self.file_name.split(".")[0] + extension,
         )
-        dialog.save(self, None, self.on_save_file_response)
+        dialog.save(self, None, self.on_frames_file_response)
 
-    def on_save_file_response(self, dialog, response):
+    def on_frames_file_response(self, dialog, response):
         try:
             file = dialog.save_finish(response)
         except Exception:
             return
 
         if file:
-            file_path = file.get_path()
-            self.save_as_image(file_path)
+            self.export_frames(file.get_path())
+
+    def export_frames(self, filepath):
+        lower = self.f3d_viewer.lower_time_range
+        upper = self.f3d_viewer.upper_time_range
+        mode = self.get_frames_mode()
+
+        animation_time = None
+        if upper > lower and mode != MODE_ANIMATION:
+            animation_time = self.f3d_viewer.animation_time
+
+        request = FrameExportRequest(
+            filepath,
+            self.f3d_viewer.get_scene_paths(self.f3d_viewer.loaded_files),
+            self.f3d_viewer.settings,
+            self.f3d_viewer.get_camera_state(),
+            mode,
+            int(self.frames_count_spin.get_value()),
+            self.frames_rate_spin.get_value(),
+            up_dirs_vector[self.f3d_viewer.settings.get(
+                "scene.up_direction", "+Y")],
+            (lower, upper),
+            self.camera_path,
+            animation_time=animation_time,
+            width=int(self.frames_width_spin.get_value()),
+            height=int(self.frames_height_spin.get_value()),
+            supersampling=int(self.frames_supersampling_spin.get_value()),
+            view_height=self.f3d_viewer.get_view_height())
+
+        self.start_export(self.frame_exporter, request, _("Exporting Frames"))
+
+    def on_frames_export_finished(self, exporter, file_path):
+        if self.export_toast:
+            self.export_toast.dismiss()
+            self.export_toast = None
+
+        # Image sequences are many files, there is nothing to open
+        if os.path.isfile(file_path):
             toast = Adw.Toast(
-                title="Image Saved",
+                title=_("Video Saved"),
                 timeout=2,
-                button_label="Open",
+                button_label=_("Open"),
                 action_name="app.show-image-externally",
                 action_target=GLib.Variant("s", file_path)
             )
             self.toast_overlay.add_toast(toast)
+        else:
+            self.send_toast(_("Frames Saved"))
+
+    def on_export_viewer_size_clicked(self, button):
+        scale = self.f3d_viewer.get_scale_factor()
+        self.export_width_spin.set_value(self.f3d_viewer.get_width() * scale)
+        self.export_height_spin.set_value(
+            self.f3d_viewer.get_height() * scale)
+
+    def open_save_file_chooser(self, *args):
+        self.export_dialog.close()
+
+        dialog = Gtk.FileDialog(
+            title=_("Save File"),
+            initial_name=self.file_name.split(".")[0] + ".png",
+        )
+        dialog.save(self, None, self.on_save_file_response)
+
+    def on_save_file_response(self, dialog, response):
+        try:
+            file = dialog.save_finish(response)
+        except Exception:
+            return
+
+        if file:
+            self.save_as_image(file.get_path())
+
+    # Functions related to the performance statistics
+
+    def count_scene_elements(self):
+        total_points = total_faces = 0
+        for filepath in self.f3d_viewer.loaded_files:
+            points, faces = count_elements(filepath)
+            if points is None:
+                return None, None
+            total_points += points
+            total_faces += faces
+        return total_points, total_faces
+
+    def get_statistics(self):
+        statistics = self.f3d_viewer.render_stats.get_summary()
+        statistics["file"] = self.file_name
+        statistics["configuration"] = (
+            self.settings_action.get_state().get_string())
+        statistics["points"], statistics["faces"] = self.scene_counts
+        return statistics
+
+    def on_performance_hud_state_changed(self, action, state):
+        action.set_state(state)
+
+        if self.performance_hud_source:
+            GLib.source_remove(self.performance_hud_source)
+            self.performance_hud_source = None
+
+        self.performance_hud.set_visible(state.get_boolean())
+        if state.get_boolean():
+            self.update_performance_hud()
+            self.performance_hud_source = GLib.timeout_add(
+                500, self.update_performance_hud)
+
+    def update_performance_hud(self):
+        statistics = self.get_statistics()
+
+        def count(value):
+            return "?" if value is None else f"{value:,}"
+
+        self.performance_hud.set_label(
+            f"p50 {statistics['p50_ms']:.1f} ms  "
+            f"p95 {statistics['p95_ms']:.1f} ms  "
+            f"p99 {statistics['p99_ms']:.1f} ms\n"
+            f"{statistics['renders_per_second']:.1f} renders/s  "
+            f"{self.f3d_viewer.dropped_frames} dropped frames\n"
+            f"render {statistics['render_ms']:.0f} ms  "
+            f"options {statistics['options_ms']:.0f} ms\n"
+            f"{count(statistics['points'])} points  "
+            f"{count(statistics['faces'])} faces")
+
+        return True
+
+    def open_export_statistics_file_chooser(self, *args):
+        name = os.path.splitext(self.file_name)[0] or "exhibit"
+        dialog = Gtk.FileDialog(
+            title=_("Export Statistics"),
+            initial_name=name + "-statistics.csv",
+        )
+        dialog.save(self, None, self.on_export_statistics_response)
+
+    def on_export_statistics_response(self, dialog, response):
+        try:
+            file = dialog.save_finish(response)
+        except Exception:
+            return
+
+        statistics = self.get_statistics()
+        try:
+            with open(file.get_path(), "w", newline="") as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=CSV_COLUMNS)
+                writer.writeheader()
+                writer.writerow(
+                    {key: statistics[key] for key in CSV_COLUMNS})
+        except OSError as e:
+            self.logger.error(f"Couldn't export the statistics: {e}")
+            self.send_toast(_("Couldn't export the statistics"))
+            return
+
+        self.send_toast(_("Statistics exported"))
 
     @Gtk.Template.Callback("on_home_clicked")
     def on_home_clicked(self, btn):
@@ -1008,7 +1589,7 @@ class Viewer3dWindow(Adw.ApplicationWindow):
 
         if extension in image_patterns:
             self.load_hdri(filepath)
-        elif extension in allowed_extensions:
+        elif extension in get_allowed_extensions():
             self.logger.info("drop received")
             self.load_file(filepath=filepath)
 
@@ -1101,26 +1682,19 @@ class Viewer3dWindow(Adw.ApplicationWindow):
         self.add_action(action)
         return action
 
-    def generate_thumbnail(self, hdri_file_path, width=300, height=200):
-        base_name = os.path.basename(hdri_file_path)
-        name, _ = os.path.splitext(base_name)
-
-        thumbnail_name = f"{name}.jpeg"
-        thumbnail_filepath = os.path.join(
-            self.hdri_thumbnails_path, thumbnail_name)
-
-        with Image(filename=hdri_file_path) as img:
-            img.thumbnail(width, height)
-            img.gamma(1.7)
-            img.brightness_contrast(0, -5)
-            img.format = 'jpeg'
-            img.save(filename=thumbnail_filepath)
-
-        return thumbnail_filepath
-
     @Gtk.Template.Callback("on_close_request")
     def on_close_request(self, window):
         self.logger.debug("window closed, saving settings")
+        self.loader.stop()
+        self.prefetcher.stop()
+        self.image_exporter.cancel()
+        self.frame_exporter.cancel()
+        self.file_watcher.stop()
+        self.configuration_registry.disconnect(self.configurations_handler)
+        if self.performance_hud_source:
+            GLib.source_remove(self.performance_hud_source)
+        for handler in self.thumbnail_handlers:
+            self.thumbnail_cache.disconnect(handler)
         self.saved_settings.set_int(
             "startup-width", window.get_width())
         self.saved_settings.set_int(
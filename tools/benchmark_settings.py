@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# benchmark_settings.py
+#
+# Copyright 2024-2025 Nokse <nokse@posteo.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+"""Times applying a configuration and checking for option changes on
+WindowSettings, with the name index and with the linear scans it replaced.
+
+Run it from the root of the repository:
+
+    python3 tools/benchmark_settings.py
+"""
+
+import os
+import sys
+import json
+import timeit
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The logger writes its file there
+os.environ.setdefault("XDG_DATA_HOME", tempfile.mkdtemp())
+
+from src import logger_lib  # noqa: E402
+from src.settings_manager import WindowSettings, SettingType  # noqa: E402
+
+REPEAT = 5
+NUMBER = 200
+
+
+# How set_setting and get_user_customized_settings worked before the index
+def scan_set_setting(settings, key, value):
+    for setting in settings:
+        if key == setting.name:
+            setting.set_value(value)
+            return
+
+
+def scan_get_settings(settings):
+    options = {}
+    for setting_type in (SettingType.VIEW, SettingType.OTHER):
+        for setting in settings:
+            if setting.type == setting_type:
+                options[setting.name] = setting.value
+    return options
+
+
+# The same steps as Viewer3dWindow.set_settings_from_name
+def apply_configuration(settings, configuration, set_setting):
+    options = settings.get_default_user_customizable_settings()
+    options.update(configuration["view-settings"])
+
+    with settings.transaction():
+        for key, value in options.items():
+            set_setting(key, value)
+        for key, value in configuration["other-settings"].items():
+            set_setting(key, value)
+
+
+# The same steps as Viewer3dWindow.check_for_options_change
+def check_for_changes(settings, configuration, get_settings):
+    state_options = settings.get_default_user_customizable_settings()
+    state_options.update(configuration["view-settings"])
+    state_options.update(configuration["other-settings"])
+
+    current_settings = get_settings()
+    for key, value in state_options.items():
+        if key in current_settings and current_settings[key] != value:
+            return True
+    return False
+
+
+def measure(function):
+    best = min(timeit.repeat(function, repeat=REPEAT, number=NUMBER))
+    return best / NUMBER * 1_000_000
+
+
+def main():
+    logger_lib.init()
+
+    with open(os.path.join(ROOT, "data", "configurations.json"), "r") as file:
+        configurations = list(json.load(file).values())
+
+    settings = WindowSettings()
+    ways = {
+        "index": (settings.set_setting, settings.get_user_customized_settings),
+        "scan": (
+            lambda key, value: scan_set_setting(settings, key, value),
+            lambda: scan_get_settings(settings),
+        ),
+    }
+
+    print(f"{len(settings)} settings, {len(configurations)} configurations")
+    print(f"{'':>8} {'apply':>10} {'check':>10} {'edit+check':>12}")
+
+    for name, (set_setting, get_settings) in ways.items():
+        # Every configuration in turn, so that the values actually change
+        def apply():
+            for configuration in configurations:
+                apply_configuration(settings, configuration, set_setting)
+
+        def check():
+            check_for_changes(settings, configurations[0], get_settings)
+
+        # A setting changed from the UI drops the cached values first
+        def edit_and_check():
+            set_setting("point-size", settings.get_setting("point-size").value + 1)
+            check_for_changes(settings, configurations[0], get_settings)
+
+        apply_time = measure(apply) / len(configurations)
+        check_time = measure(check)
+        edit_time = measure(edit_and_check)
+        print(
+            f"{name:>8} {apply_time:8.1f}us {check_time:8.1f}us {edit_time:10.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()